@@ -1,34 +1,127 @@
-from collections import defaultdict
-from itertools import chain, cycle
-from uuid import uuid4
-
+from array import array
+from collections import defaultdict, namedtuple
+from heapq import heappop, heappush
 
 SYMBOLS_TO_TUPS = {"^": (0, -1), "v": (0, 1), "<": (-1, 0), ">": (1, 0)}
 TUPS_TO_SYMBOLS = {(0, -1): "^", (0, 1): "v", (-1, 0): "<", (1, 0): ">"}
 
+# Directions are coded clockwise from up, so turning is +/- 1 mod 4
+DIRECTION_TUPS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+SYMBOLS_TO_DIRECTIONS = {
+    TUPS_TO_SYMBOLS[tup]: direction for direction, tup in enumerate(DIRECTION_TUPS)
+}
+STRAIGHT, SLASH, BACKSLASH, INTERSECTION, OFF_TRACK = range(5)
+TRACK_CODES = {
+    "|": STRAIGHT,
+    "-": STRAIGHT,
+    "/": SLASH,
+    "\\": BACKSLASH,
+    "+": INTERSECTION,
+}
+# Intersections turn left, go straight, then turn right, over and over
+NUM_TURN_STATES = 3
+
+
+def build_turn_tables():
+    """
+    Build flat lookup tables, indexed by
+    ``(track * NUM_TURN_STATES + turn_state) * 4 + direction``, for the
+    direction and turn state a cart has after entering a track cell.
+    """
+    next_direction = array("b")
+    next_turn_state = array("b")
+    for track in range(OFF_TRACK + 1):
+        for turn_state in range(NUM_TURN_STATES):
+            for direction in range(4):
+                new_turn_state = turn_state
+                if track == SLASH:
+                    # up <-> right, down <-> left
+                    new_direction = (1, 0, 3, 2)[direction]
+                elif track == BACKSLASH:
+                    # up <-> left, down <-> right
+                    new_direction = (3, 2, 1, 0)[direction]
+                elif track == INTERSECTION:
+                    new_direction = (direction + turn_state - 1) % 4
+                    new_turn_state = (turn_state + 1) % NUM_TURN_STATES
+                elif track == STRAIGHT:
+                    new_direction = direction
+                else:
+                    new_direction = -1
+                next_direction.append(new_direction)
+                next_turn_state.append(new_turn_state)
+    return next_direction, next_turn_state
+
+
+NEXT_DIRECTION, NEXT_TURN_STATE = build_turn_tables()
+
+Cart = namedtuple("Cart", ["x", "y", "facing", "id"])
+# Events yielded by iter_crashes
+Crash = namedtuple("Crash", ["tick", "position", "cart_ids"])
+Survivor = namedtuple("Survivor", ["tick", "cart"])
+
 
-class Cart:
-    def __init__(self, *, x, y, facing, id=None):
-        self.x = x
-        self.y = y
-        self.turn_cycle = cycle([(-1, 1), None, (1, -1)])
-        self.facing = facing
-        self.id = str(uuid4())
+class Carts:
+    """
+    Struct-of-arrays cart store. Cart ``i`` is at ``(x[i], y[i])``, facing
+    ``direction[i]`` with intersection turn state ``turn_state[i]``, and cell
+    ``y * width + x`` of ``occupancy`` holds ``i + 1`` for the cart there or
+    0 for an empty cell.
+    """
 
-    def __repr__(self):
-        return f"Cart(x={self.x}, y={self.y}, facing={self.facing}, id={self.id})"
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.x = array("l")
+        self.y = array("l")
+        self.direction = array("b")
+        self.turn_state = array("b")
+        self.alive = array("b")
+        self.occupancy = array("l", bytes(array("l").itemsize * width * height))
+        self.order = []
+        self.num_alive = 0
+        # Where carts crashed on the last tick, for print_state, and the ids
+        # of the cart that moved and the one it hit for each of them
+        self.crash_sites = []
+        self.crashed_carts = []
 
-    def __lt__(self, other):
-        return (self.y, self.x) < (other.y, other.x)
+    def add(self, x, y, direction):
+        cart_id = len(self.x)
+        self.x.append(x)
+        self.y.append(y)
+        self.direction.append(direction)
+        self.turn_state.append(0)
+        cell = y * self.width + x
+        if self.occupancy[cell]:
+            raise ValueError(f"Two carts start at {(x, y)}")
+        self.occupancy[cell] = cart_id + 1
+        self.alive.append(1)
+        self.order.append(cart_id)
+        self.num_alive += 1
+        return cart_id
 
-    def __hash__(self):
-        return hash(self.id)
+    def __len__(self):
+        return self.num_alive
+
+    def __iter__(self):
+        for cart_id in self.order:
+            if self.alive[cart_id]:
+                yield self.cart(cart_id)
+
+    def cart(self, cart_id):
+        return Cart(
+            self.x[cart_id],
+            self.y[cart_id],
+            DIRECTION_TUPS[self.direction[cart_id]],
+            cart_id,
+        )
 
 
 def parse_puzzle(puzzle):
     puzzle = puzzle.splitlines()
+    height = len(puzzle)
+    width = max((len(row) for row in puzzle), default=0)
     tracks = []
-    carts = []
+    carts = Carts(width, height)
 
     for y, row in enumerate(puzzle):
         track_row = []
@@ -36,7 +129,7 @@ def parse_puzzle(puzzle):
             if char not in SYMBOLS_TO_TUPS:
                 track_char = char
             else:
-                carts.append(Cart(x=x, y=y, facing=SYMBOLS_TO_TUPS[char]))
+                carts.add(x, y, SYMBOLS_TO_DIRECTIONS[char])
                 if char == "<" or char == ">":
                     track_char = "-"
                 else:
@@ -47,82 +140,403 @@ def parse_puzzle(puzzle):
     return tracks, carts
 
 
-def advance_carts(carts, tracks, remove_crashed=False):
-    cart_positions = defaultdict(set)
-    for cart in carts:
-        cart_positions[(cart.x, cart.y)].add(cart)
-    crashed = False
-    for cart in sorted(carts):
-        # Check for already crashed cart
-        old_pos = (cart.x, cart.y)
-        if len(cart_positions[old_pos]) > 1:
+def encode_tracks(tracks, width):
+    """Flatten ``tracks`` into one track code per cell, row by row."""
+    codes = bytearray([OFF_TRACK]) * (width * len(tracks))
+    for y, row in enumerate(tracks):
+        for x, char in enumerate(row):
+            codes[y * width + x] = TRACK_CODES.get(char, OFF_TRACK)
+    return codes
+
+
+def advance_carts(carts, tracks, track_codes=None):
+    """
+    Move every cart one step, in reading order, updating ``carts`` in place.
+
+    Crashed carts are removed right away, so a later cart can drive through
+    the crash site in the same tick. Returns the positions of this tick's
+    crashes. ``track_codes`` is ``encode_tracks(tracks, carts.width)``, which
+    is worth computing once when advancing many ticks.
+    """
+    width = carts.width
+    if track_codes is None:
+        track_codes = encode_tracks(tracks, width)
+    xs, ys = carts.x, carts.y
+    directions, turn_states = carts.direction, carts.turn_state
+    alive, occupancy = carts.alive, carts.occupancy
+    crashes = []
+    crashed_carts = []
+    carts.order.sort(key=lambda cart_id: ys[cart_id] * width + xs[cart_id])
+    for cart_id in carts.order:
+        if not alive[cart_id]:
+            continue
+        direction = directions[cart_id]
+        old_x = xs[cart_id]
+        old_y = ys[cart_id]
+        occupancy[old_y * width + old_x] = 0
+        new_x = old_x + DIRECTION_TUPS[direction][0]
+        new_y = old_y + DIRECTION_TUPS[direction][1]
+        xs[cart_id] = new_x
+        ys[cart_id] = new_y
+        cell = new_y * width + new_x
+        other = occupancy[cell]
+        if other:
+            alive[cart_id] = alive[other - 1] = 0
+            carts.num_alive -= 2
+            occupancy[cell] = 0
+            crashes.append((new_x, new_y))
+            crashed_carts.append((cart_id, other - 1))
             continue
-        else:
-            cart_positions[old_pos].remove(cart)
-        new_y = cart.y + cart.facing[1]
-        new_x = cart.x + cart.facing[0]
-        next_track = tracks[new_y][new_x]
-        cart.y = new_y
-        cart.x = new_x
-        pos = (cart.x, cart.y)
-        if pos in cart_positions:
-            print(f"Crash at {pos}")
-            crashed = True
-        cart_positions[pos].add(cart)
-        if next_track == "+":
-            turn = next(cart.turn_cycle)
-            if turn is not None:
-                cart.facing = (cart.facing[1] * turn[1], cart.facing[0] * turn[0])
-        elif next_track == "/":
-            cart.facing = (cart.facing[1] * -1, cart.facing[0] * -1)
-        elif next_track == "\\":
-            cart.facing = (cart.facing[1], cart.facing[0])
-        elif next_track != "|" and next_track != "-":
-            raise ValueError(f"This should never happen. Got '{next_track}'")
-    return (
-        list(
-            chain.from_iterable(
-                cart_set
-                for cart_set in cart_positions.values()
-                if not remove_crashed or len(cart_set) == 1
+        occupancy[cell] = cart_id + 1
+        table_index = (
+            track_codes[cell] * NUM_TURN_STATES + turn_states[cart_id]
+        ) * 4 + direction
+        new_direction = NEXT_DIRECTION[table_index]
+        if new_direction < 0:
+            raise ValueError(f"This should never happen. Got '{tracks[new_y][new_x]}'")
+        directions[cart_id] = new_direction
+        turn_states[cart_id] = NEXT_TURN_STATE[table_index]
+    carts.crash_sites = crashes
+    carts.crashed_carts = crashed_carts
+    if crashes:
+        carts.order = [cart_id for cart_id in carts.order if alive[cart_id]]
+    return crashes
+
+
+def is_decision_point(code):
+    return code == SLASH or code == BACKSLASH or code == INTERSECTION
+
+
+def follow_track(track_codes, width, height, x, y, direction):
+    """
+    Drive straight from ``(x, y)`` in ``direction`` until the next curve or
+    intersection, and return its position and how many steps away it is.
+    """
+    dx, dy = DIRECTION_TUPS[direction]
+    steps = 0
+    while True:
+        x += dx
+        y += dy
+        steps += 1
+        if not (0 <= x < width and 0 <= y < height):
+            raise ValueError(f"Track runs off the map at {(x, y)}")
+        code = track_codes[y * width + x]
+        if code == OFF_TRACK:
+            raise ValueError(f"Track ends at {(x, y)}")
+        if code != STRAIGHT:
+            return (x, y), steps
+
+
+def build_track_graph(track_codes, width, height):
+    """
+    Compile the tracks into a graph of decision points. Maps each curve or
+    intersection and direction a cart can leave it in to the next decision
+    point along that way and the number of steps to it.
+    """
+    graph = {}
+    for cell, code in enumerate(track_codes):
+        if not is_decision_point(code):
+            continue
+        y, x = divmod(cell, width)
+        for direction in range(4):
+            try:
+                graph[(x, y), direction] = follow_track(
+                    track_codes, width, height, x, y, direction
+                )
+            except ValueError:
+                # Not a way out of this curve
+                pass
+    return graph
+
+
+# A cart driving straight from ``start`` at ``start_tick`` until it reaches the
+# decision point ``end`` at ``end_tick``. ``corridor`` is the pair of decision
+# points at either end of the straight run of track it is on.
+Segment = namedtuple(
+    "Segment", ["start", "start_tick", "direction", "end", "end_tick", "corridor"]
+)
+
+
+def segment_position(segment, tick):
+    dx, dy = DIRECTION_TUPS[segment.direction]
+    steps = tick - segment.start_tick
+    return segment.start[0] + dx * steps, segment.start[1] + dy * steps
+
+
+def solve_meeting(segment_a, segment_b, lag):
+    """
+    Solve ``segment_position(a, t) == segment_position(b, t - lag)`` for ``t``.
+
+    Returns ``None`` when there is no integer solution and ``True`` when every
+    ``t`` is one, which happens when both carts drive the same way in step.
+    """
+    (ax, ay), (bx, by) = segment_a.start, segment_b.start
+    adx, ady = DIRECTION_TUPS[segment_a.direction]
+    bdx, bdy = DIRECTION_TUPS[segment_b.direction]
+    # a0 + da * t == b0 + db * (t - lag), per coordinate
+    coef_x, coef_y = adx - bdx, ady - bdy
+    rhs_x = bx - bdx * (segment_b.start_tick + lag) - ax + adx * segment_a.start_tick
+    rhs_y = by - bdy * (segment_b.start_tick + lag) - ay + ady * segment_a.start_tick
+    if not coef_x and not coef_y:
+        return True if not rhs_x and not rhs_y else None
+    if coef_x:
+        tick, remainder = divmod(rhs_x, coef_x)
+        if remainder or coef_y * tick != rhs_y:
+            return None
+    else:
+        tick, remainder = divmod(rhs_y, coef_y)
+        if remainder or rhs_x:
+            return None
+    return tick
+
+
+def find_segment_crash(segment_a, segment_b, width):
+    """
+    Find the first tick on which carts on ``segment_a`` and ``segment_b`` crash.
+
+    Returns ``(tick, mover_key, position, a_moved)``, where ``mover_key`` is
+    the reading order key of the cart whose move causes the crash and
+    ``a_moved`` says whether that is the cart on ``segment_a``, or returns
+    ``None`` if they never crash. A tick ``t`` moves a cart from its position
+    at ``t - 1`` to its position at ``t``, so the carts crash if they move
+    into the same cell on that tick, or if one moves into the cell the other
+    has not left yet.
+    """
+
+    def key(segment, tick):
+        x, y = segment_position(segment, tick)
+        return y * width + x
+
+    best = None
+    # Both carts move into the same cell
+    first = max(segment_a.start_tick, segment_b.start_tick) + 1
+    last = min(segment_a.end_tick, segment_b.end_tick)
+    tick = solve_meeting(segment_a, segment_b, 0)
+    if tick is not None and tick is not True and first <= tick <= last:
+        key_a, key_b = key(segment_a, tick - 1), key(segment_b, tick - 1)
+        best = (
+            tick,
+            max(key_a, key_b),
+            segment_position(segment_a, tick),
+            key_a > key_b,
+        )
+    # One cart moves into the cell the other is still in
+    for mover, other in ((segment_a, segment_b), (segment_b, segment_a)):
+        first = max(mover.start_tick, other.start_tick) + 1
+        last = min(mover.end_tick, other.end_tick + 1)
+        tick = solve_meeting(mover, other, 1)
+        if tick is True:
+            tick = first
+        if tick is None or not first <= tick <= last:
+            continue
+        mover_key = key(mover, tick - 1)
+        if mover_key > key(other, tick - 1):
+            # The other cart gets out of the way first
+            continue
+        crash = (tick, mover_key, segment_position(mover, tick), mover is segment_a)
+        if best is None or crash < best:
+            best = crash
+    return best
+
+
+class EventSimulation:
+    """
+    Event-driven alternative to calling ``advance_carts`` every tick.
+
+    Carts jump straight from one decision point of ``build_track_graph`` to the
+    next, with a priority queue holding the tick of each cart's next arrival
+    and of every crash found so far. Whenever a cart starts down a new
+    straight run, it is checked against the carts sharing that run or either
+    end of it with ``find_segment_crash``, so the cost is per event rather
+    than per tick. Crashes follow the same rules as ``advance_carts``.
+    """
+
+    def __init__(self, tracks, carts):
+        self.width = carts.width
+        self.height = carts.height
+        self.track_codes = encode_tracks(tracks, self.width)
+        self.graph = build_track_graph(self.track_codes, self.width, self.height)
+        self.turn_state = array("b", carts.turn_state)
+        self.segments = {}
+        self.alive = set()
+        self.corridor_carts = defaultdict(set)
+        self.point_carts = defaultdict(set)
+        self.queue = []
+        for cart_id, alive in enumerate(carts.alive):
+            if not alive:
+                continue
+            x, y = carts.x[cart_id], carts.y[cart_id]
+            direction = carts.direction[cart_id]
+            end, steps = follow_track(
+                self.track_codes, self.width, self.height, x, y, direction
+            )
+            behind, _ = follow_track(
+                self.track_codes, self.width, self.height, x, y, (direction + 2) % 4
             )
-        ),
-        crashed,
-    )
+            self.alive.add(cart_id)
+            self.start_segment(
+                cart_id,
+                Segment((x, y), 0, direction, end, steps, frozenset((behind, end))),
+            )
+
+    def __len__(self):
+        return len(self.alive)
+
+    def start_segment(self, cart_id, segment):
+        for other_id in (
+            self.corridor_carts[segment.corridor]
+            | self.point_carts[segment.start]
+            | self.point_carts[segment.end]
+        ):
+            crash = find_segment_crash(segment, self.segments[other_id], self.width)
+            if crash is not None:
+                tick, mover_key, position, moved = crash
+                cart_ids = (cart_id, other_id) if moved else (other_id, cart_id)
+                heappush(self.queue, (tick, 0, mover_key, position, *cart_ids))
+        self.segments[cart_id] = segment
+        self.corridor_carts[segment.corridor].add(cart_id)
+        self.point_carts[segment.start].add(cart_id)
+        self.point_carts[segment.end].add(cart_id)
+        heappush(self.queue, (segment.end_tick, 1, cart_id))
+
+    def remove(self, cart_id):
+        self.alive.discard(cart_id)
+        segment = self.segments.pop(cart_id)
+        self.corridor_carts[segment.corridor].discard(cart_id)
+        self.point_carts[segment.start].discard(cart_id)
+        self.point_carts[segment.end].discard(cart_id)
+
+    def arrive(self, cart_id):
+        """Turn ``cart_id`` at the end of its segment and start the next one."""
+        segment = self.segments[cart_id]
+        self.corridor_carts[segment.corridor].discard(cart_id)
+        self.point_carts[segment.start].discard(cart_id)
+        self.point_carts[segment.end].discard(cart_id)
+        x, y = segment.end
+        table_index = (
+            self.track_codes[y * self.width + x] * NUM_TURN_STATES
+            + self.turn_state[cart_id]
+        ) * 4 + segment.direction
+        direction = NEXT_DIRECTION[table_index]
+        self.turn_state[cart_id] = NEXT_TURN_STATE[table_index]
+        try:
+            end, steps = self.graph[segment.end, direction]
+        except KeyError:
+            raise ValueError(f"Cart {cart_id} drove off the track at {(x, y)}")
+        self.start_segment(
+            cart_id,
+            Segment(
+                segment.end,
+                segment.end_tick,
+                direction,
+                end,
+                segment.end_tick + steps,
+                frozenset((segment.end, end)),
+            ),
+        )
+
+    def crashes(self, max_ticks=None):
+        """
+        Run until at most one cart is left, yielding ``(tick, position,
+        cart_ids)`` for every crash, in the order ``advance_carts`` finds them.
+        Stops early after simulating ``max_ticks`` ticks.
+        """
+        queue = self.queue
+        while len(self.alive) > 1 and queue:
+            if max_ticks is not None and queue[0][0] > max_ticks:
+                return
+            event = heappop(queue)
+            if event[1] == 1:
+                if event[2] in self.alive:
+                    self.arrive(event[2])
+                continue
+            tick, _, _, position, cart_id, other_id = event
+            if cart_id in self.alive and other_id in self.alive:
+                self.remove(cart_id)
+                self.remove(other_id)
+                yield tick, position, (cart_id, other_id)
+
+    def cart(self, cart_id, tick):
+        """Where ``cart_id`` is, and which way it faces, once ``tick`` is over."""
+        while self.segments[cart_id].end_tick <= tick:
+            self.arrive(cart_id)
+        segment = self.segments[cart_id]
+        x, y = segment_position(segment, tick)
+        return Cart(x, y, DIRECTION_TUPS[segment.direction], cart_id)
 
 
 def print_state(carts, tracks):
     cart_chars = {}
     for cart in carts:
-        pos = (cart.x, cart.y)
-        if pos not in cart_chars:
-            cart_chars[pos] = TUPS_TO_SYMBOLS[cart.facing]
-        else:
-            cart_chars[pos] = "X"
+        cart_chars[(cart.x, cart.y)] = TUPS_TO_SYMBOLS[cart.facing]
+    for pos in carts.crash_sites:
+        cart_chars[pos] = "X"
     for y, track_row in enumerate(tracks):
         for x, track_char in enumerate(track_row):
             print(cart_chars.get((x, y), track_char), end="")
         print()
 
 
-def find_first_crash(puzzle, verbose=False):
+def iter_crashes(puzzle, event_driven=False, max_ticks=None, verbose=False):
+    """
+    Simulate ``puzzle`` once, yielding a ``Crash`` for every crash, in the
+    order they happen, and then a ``Survivor`` once a single cart is left.
+
+    ``cart_ids`` are the cart that moved and the one it hit. Stops after
+    ``max_ticks`` ticks if carts are still driving around by then.
+    ``event_driven`` uses ``EventSimulation`` rather than stepping every tick,
+    unless ``verbose`` asks to see every tick.
+    """
     tracks, carts = parse_puzzle(puzzle)
-    crashed = False
-    while not crashed:
-        if verbose:
-            print()
-            print_state(carts, tracks)
-        carts, crashed = advance_carts(carts, tracks, remove_crashed=False)
+    tick = 0
+    if event_driven and not verbose:
+        simulation = EventSimulation(tracks, carts)
+        for tick, position, cart_ids in simulation.crashes(max_ticks=max_ticks):
+            yield Crash(tick, position, cart_ids)
+        if len(simulation) == 1:
+            (cart_id,) = simulation.alive
+            yield Survivor(tick, simulation.cart(cart_id, tick))
+        return
+
+    track_codes = encode_tracks(tracks, carts.width)
     if verbose:
         print()
         print_state(carts, tracks)
-
-
-def find_last_cart(puzzle, verbose=False):
-    tracks, carts = parse_puzzle(puzzle)
-    while len(carts) > 1:
+    while len(carts) > 1 and (max_ticks is None or tick < max_ticks):
+        tick += 1
+        advance_carts(carts, tracks, track_codes=track_codes)
         if verbose:
             print()
             print_state(carts, tracks)
-        carts = advance_carts(carts, tracks, remove_crashed=True)[0]
-    return carts[0]
+        for position, cart_ids in zip(carts.crash_sites, carts.crashed_carts):
+            yield Crash(tick, position, cart_ids)
+    if len(carts) == 1:
+        yield Survivor(tick, next(iter(carts)))
+
+
+def find_first_crash(puzzle, verbose=False, event_driven=False):
+    for event in iter_crashes(puzzle, event_driven=event_driven, verbose=verbose):
+        if isinstance(event, Crash):
+            print(f"Crash at {event.position}")
+            return event.position
+        break
+    raise ValueError("No carts ever crash")
+
+
+def find_last_cart(puzzle, verbose=False, event_driven=False):
+    for event in iter_crashes(puzzle, event_driven=event_driven, verbose=verbose):
+        if isinstance(event, Survivor):
+            return event.cart
+    raise ValueError("Every cart crashed")
+
+
+def find_first_crash_and_last_cart(puzzle, event_driven=False):
+    """Answer both parts from a single run of the simulation."""
+    first_crash = None
+    last_cart = None
+    for event in iter_crashes(puzzle, event_driven=event_driven):
+        if isinstance(event, Survivor):
+            last_cart = event.cart
+        elif first_crash is None:
+            first_crash = event.position
+    return first_crash, last_cart
@@ -1,188 +1,229 @@
-from collections import Counter, defaultdict
+import mmap
+import os
+import re
+from collections import Counter
+from contextlib import contextmanager
+from itertools import islice
 from pprint import pprint
 
-
-def addr(registers, a, b, c):
-    """(add register) stores into register C the result of adding register A and register B."""
-    registers[c] = registers[a] + registers[b]
-    return registers
-
-
-def addi(registers, a, b, c):
-    """(add immediate) stores into register C the result of adding register A and value B."""
-    registers[c] = registers[a] + b
-    return registers
-
-
-def mulr(registers, a, b, c):
-    """(multiply register) stores into register C the result of multiplying register A and register B."""
-    registers[c] = registers[a] * registers[b]
-    return registers
-
-
-def muli(registers, a, b, c):
-    """(multiply immediate) stores into register C the result of multiplying register A and value B."""
-    registers[c] = registers[a] * b
-    return registers
-
-
-def banr(registers, a, b, c):
-    """(bitwise AND register) stores into register C the result of the bitwise AND of register A and register B."""
-    registers[c] = registers[a] & registers[b]
-    return registers
-
-
-def bani(registers, a, b, c):
-    """(bitwise AND immediate) stores into register C the result of the bitwise AND of register A and value B."""
-    registers[c] = registers[a] & b
-    return registers
-
-
-def borr(registers, a, b, c):
-    """(bitwise OR register) stores into register C the result of the bitwise OR of register A and register B."""
-    registers[c] = registers[a] | registers[b]
-    return registers
-
-
-def bori(registers, a, b, c):
-    """(bitwise OR immediate) stores into register C the result of the bitwise OR of register A and value B."""
-    registers[c] = registers[a] | b
-    return registers
-
-
-def setr(registers, a, b, c):
-    """(set register) copies the contents of register A into register C. (Input B is ignored.)"""
-    registers[c] = registers[a]
-    return registers
-
-
-def seti(registers, a, b, c):
-    """(set immediate) stores value A into register C. (Input B is ignored.)"""
-    registers[c] = a
-    return registers
-
-
-def gtir(registers, a, b, c):
-    """(greater-than immediate/register) sets register C to 1 if value A is greater than register B. Otherwise, register C is set to 0."""
-    registers[c] = int(a > registers[b])
-    return registers
-
-
-def gtri(registers, a, b, c):
-    """(greater-than register/immediate) sets register C to 1 if register A is greater than value B. Otherwise, register C is set to 0."""
-    registers[c] = int(registers[a] > b)
-    return registers
-
-
-def gtrr(registers, a, b, c):
-    """(greater-than register/register) sets register C to 1 if register A is greater than register B. Otherwise, register C is set to 0."""
-    registers[c] = int(registers[a] > registers[b])
-    return registers
-
-
-def eqir(registers, a, b, c):
-    """(equal immediate/register) sets register C to 1 if value A is equal to register B. Otherwise, register C is set to 0."""
-    registers[c] = int(a == registers[b])
-    return registers
-
-
-def eqri(registers, a, b, c):
-    """(equal register/immediate) sets register C to 1 if register A is equal to value B. Otherwise, register C is set to 0."""
-    registers[c] = int(registers[a] == b)
-    return registers
-
-
-def eqrr(registers, a, b, c):
-    """(equal register/register) sets register C to 1 if register A is equal to register B. Otherwise, register C is set to 0."""
-    registers[c] = int(registers[a] == registers[b])
-    return registers
-
-
-INSTRUCTIONS = {
-    addr,
-    addi,
-    mulr,
-    muli,
-    banr,
-    bani,
-    borr,
-    bori,
-    setr,
-    seti,
-    gtir,
-    gtri,
-    gtrr,
-    eqir,
-    eqri,
-    eqrr,
+import numpy as np
+
+from elfcode import OPCODE_SOURCE, OPCODES, compile_program, execute
+
+# Bit order of the candidate masks
+OPCODE_NAMES = list(OPCODES)
+# Vectorized opcodes over whole sample columns, returning the value stored in C
+VECTOR_OPCODES = {
+    "addr": lambda a, b, reg_a, reg_b: reg_a + reg_b,
+    "addi": lambda a, b, reg_a, reg_b: reg_a + b,
+    "mulr": lambda a, b, reg_a, reg_b: reg_a * reg_b,
+    "muli": lambda a, b, reg_a, reg_b: reg_a * b,
+    "banr": lambda a, b, reg_a, reg_b: reg_a & reg_b,
+    "bani": lambda a, b, reg_a, reg_b: reg_a & b,
+    "borr": lambda a, b, reg_a, reg_b: reg_a | reg_b,
+    "bori": lambda a, b, reg_a, reg_b: reg_a | b,
+    "setr": lambda a, b, reg_a, reg_b: reg_a,
+    "seti": lambda a, b, reg_a, reg_b: a,
+    "gtir": lambda a, b, reg_a, reg_b: a > reg_b,
+    "gtri": lambda a, b, reg_a, reg_b: reg_a > b,
+    "gtrr": lambda a, b, reg_a, reg_b: reg_a > reg_b,
+    "eqir": lambda a, b, reg_a, reg_b: a == reg_b,
+    "eqri": lambda a, b, reg_a, reg_b: reg_a == b,
+    "eqrr": lambda a, b, reg_a, reg_b: reg_a == reg_b,
 }
+_NUMBER = rb"\s*(-?\d+)"
+_REGISTERS = rb"\s*\[" + rb"\s*,".join([_NUMBER] * 4) + rb"\s*\]"
+SAMPLE_PATTERN = re.compile(
+    rb"Before:" + _REGISTERS + _NUMBER * 4 + rb"\s*After:" + _REGISTERS
+)
+STATEMENT_PATTERN = re.compile(
+    rb"^[ \t]*" + rb"[ \t]+".join([rb"(-?\d+)"] * 4) + rb"[ \t]*\r?$", re.MULTILINE
+)
+PROGRAM_START_PATTERN = re.compile(rb"(?:\r?\n[ \t]*){4}")
+# Samples loaded into arrays at a time, which bounds memory use
+CHUNK_SIZE = 1 << 16
+POPCOUNT = np.array([bin(mask).count("1") for mask in range(1 << 16)], dtype=np.uint8)
+
+
+@contextmanager
+def map_puzzle(puzzle_input_file):
+    """Memory-map the puzzle input read-only, so it is never read in whole."""
+    with open(puzzle_input_file, "rb") as puzzle_input:
+        if not os.fstat(puzzle_input.fileno()).st_size:
+            # Empty files can't be mapped
+            yield b""
+            return
+        with mmap.mmap(puzzle_input.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def find_program_start(data):
+    """The program starts after three blank lines, following the samples."""
+    match = PROGRAM_START_PATTERN.search(data)
+    return match.end() if match else len(data)
+
+
+def iter_samples(puzzle_input_file):
+    with map_puzzle(puzzle_input_file) as data:
+        for match in SAMPLE_PATTERN.finditer(data, 0, find_program_start(data)):
+            values = [int(value) for value in match.groups()]
+            yield values[:4], tuple(values[4:8]), values[8:]
+
+
+def iter_program(puzzle_input_file):
+    with map_puzzle(puzzle_input_file) as data:
+        for match in STATEMENT_PATTERN.finditer(data, find_program_start(data)):
+            yield tuple(int(value) for value in match.groups())
 
 
 def parse_puzzle(puzzle_input_file):
-    samples = []
-    program = []
-    with open(puzzle_input_file, "r") as puzzle_input:
-        blank_count = 0
-        for line in puzzle_input:
-            line = line.strip()
-            if line.startswith("Before:"):
-                blank_count = 0
-                before = eval(line.split(":")[1])
-            elif line.startswith("After:"):
-                after = eval(line.split(":")[1])
-                samples.append((before, statement, after))
-            elif not line:
-                blank_count += 1
-            else:
-                statement = tuple(int(x) for x in line.split())
-                if blank_count > 2:
-                    program.append(statement)
-    return samples, program
+    return list(iter_samples(puzzle_input_file)), list(iter_program(puzzle_input_file))
+
+
+def load_samples(samples):
+    """Stack ``(before, statement, after)`` samples into three ``(N, 4)`` arrays."""
+    befores, statements, afters = [], [], []
+    for before, statement, after in samples:
+        befores.append(before)
+        statements.append(statement)
+        afters.append(after)
+    return tuple(
+        np.array(rows, dtype=np.int64).reshape(-1, 4)
+        for rows in (befores, statements, afters)
+    )
+
+
+def iter_sample_chunks(samples, chunk_size=CHUNK_SIZE):
+    """Group a stream of samples into ``load_samples`` arrays of ``chunk_size``."""
+    samples = iter(samples)
+    while True:
+        chunk = load_samples(islice(samples, chunk_size))
+        if not len(chunk[0]):
+            return
+        yield chunk
+
+
+def candidate_masks(befores, statements, afters):
+    """
+    Return a 16-bit mask per sample with bit ``i`` set if the ``i``-th
+    instruction in ``OPCODE_NAMES`` turns ``before`` into ``after``.
+
+    Register operands outside the four registers never match.
+    """
+    rows = np.arange(len(befores))
+    _, a, b, c = statements.T
+    num_registers = befores.shape[1]
+    valid_a = (a >= 0) & (a < num_registers)
+    valid_b = (b >= 0) & (b < num_registers)
+    valid_c = (c >= 0) & (c < num_registers)
+    reg_a = befores[rows, np.clip(a, 0, num_registers - 1)]
+    reg_b = befores[rows, np.clip(b, 0, num_registers - 1)]
+    c = np.clip(c, 0, num_registers - 1)
+    # Every register but C has to come through unchanged
+    untouched = np.arange(num_registers) != c[:, None]
+    unchanged = valid_c & np.all((befores == afters) | ~untouched, axis=1)
+    target = afters[rows, c]
+    masks = np.zeros(len(befores), dtype=np.uint16)
+    for bit, name in enumerate(OPCODE_NAMES):
+        matches = unchanged & (VECTOR_OPCODES[name](a, b, reg_a, reg_b) == target)
+        if "{ra}" in OPCODE_SOURCE[name]:
+            matches &= valid_a
+        if "{rb}" in OPCODE_SOURCE[name]:
+            matches &= valid_b
+        masks |= matches.astype(np.uint16) << bit
+    return masks
+
+
+def opcode_masks(opcodes, masks):
+    """Intersect the candidate masks of all samples with the same opcode number."""
+    order = np.argsort(opcodes, kind="stable")
+    codes, starts = np.unique(opcodes[order], return_index=True)
+    reduced = np.bitwise_and.reduceat(masks[order], starts)
+    return dict(zip(codes.tolist(), reduced.tolist()))
+
+
+def resolve_opcodes(possibilities):
+    """
+    Resolve opcode numbers to instruction names by constraint propagation
+    over their candidate masks.
+
+    Raises ValueError if no consistent mapping exists or it is ambiguous.
+    """
+    possibilities = dict(possibilities)
+    # Only when every opcode number is sampled must the mapping be one-to-one,
+    # so that an option left to a single opcode has to be its own
+    one_to_one = len(possibilities) == len(OPCODE_NAMES)
+    codes_to_names = {}
+    while possibilities:
+        for code, mask in possibilities.items():
+            if not mask:
+                raise ValueError(f"No instruction is consistent with opcode {code}")
+        # An opcode with one option left, or an option only one opcode has left
+        resolved = next(
+            (
+                (code, mask)
+                for code, mask in possibilities.items()
+                if POPCOUNT[mask] == 1
+            ),
+            None,
+        )
+        if resolved is None and one_to_one:
+            for bit in range(len(OPCODE_NAMES)):
+                owners = [
+                    code for code, mask in possibilities.items() if mask >> bit & 1
+                ]
+                if len(owners) == 1:
+                    resolved = (owners[0], 1 << bit)
+                    break
+        if resolved is None:
+            raise ValueError(
+                "Opcodes are ambiguous: "
+                + ", ".join(
+                    f"{code}: {mask_names(mask)}"
+                    for code, mask in sorted(possibilities.items())
+                )
+            )
+        code, bit_mask = resolved
+        codes_to_names[code] = OPCODE_NAMES[bit_mask.bit_length() - 1]
+        del possibilities[code]
+        for other in possibilities:
+            possibilities[other] &= ~bit_mask
+    return codes_to_names
+
+
+def mask_names(mask):
+    return [name for bit, name in enumerate(OPCODE_NAMES) if mask >> bit & 1]
 
 
 def count_ambiguous_inputs(puzzle_input_file, limit=3):
     total = 0
-    for before, (_, a, b, c), after in parse_puzzle(puzzle_input_file)[0]:
-        match_count = sum(
-            int(func(before[:], a, b, c) == after) for func in INSTRUCTIONS
-        )
-        if match_count > limit:
-            total += 1
+    for befores, statements, afters in iter_sample_chunks(
+        iter_samples(puzzle_input_file)
+    ):
+        masks = candidate_masks(befores, statements, afters)
+        total += int(np.count_nonzero(POPCOUNT[masks] > limit))
     return total
 
 
 def run_puzzle_program(puzzle_input_file):
-    samples, program = parse_puzzle(puzzle_input_file)
     # Infer opcodes
-    codes_to_possibilities = defaultdict(set)
-    codes_to_funcs = {}
-    funcs_to_codes = {}
-    for before, (opcode, a, b, c), after in samples:
-        if opcode in codes_to_funcs:
-            continue
-        possible_matches = {
-            func
-            for func in INSTRUCTIONS
-            if func not in funcs_to_codes and func(before[:], a, b, c) == after
-        }
-        if opcode in codes_to_possibilities:
-            codes_to_possibilities[opcode] = codes_to_possibilities[
-                opcode
-            ].intersection(possible_matches)
-        else:
-            codes_to_possibilities[opcode] = possible_matches
-        if len(codes_to_possibilities[opcode]) == 1:
-            func = next(iter(codes_to_possibilities[opcode]))
-            codes_to_funcs[opcode] = func
-            funcs_to_codes[func] = opcode
-            del codes_to_possibilities[opcode]
-            for poss_set in codes_to_possibilities.values():
-                if func in poss_set:
-                    poss_set.remove(func)
-    pprint(codes_to_funcs)
+    possibilities = {}
+    for befores, statements, afters in iter_sample_chunks(
+        iter_samples(puzzle_input_file)
+    ):
+        chunk_possibilities = opcode_masks(
+            statements[:, 0], candidate_masks(befores, statements, afters)
+        )
+        for code, mask in chunk_possibilities.items():
+            possibilities[code] = possibilities.get(code, mask) & mask
+    codes_to_names = resolve_opcodes(possibilities)
+    pprint(codes_to_names)
 
     # Execute program
-    registers = [0] * 4
-    for opcode, a, b, c in program:
-        registers = codes_to_funcs[opcode](registers, a, b, c)
-    return registers
+    compiled = compile_program(
+        [
+            (codes_to_names[opcode], a, b, c)
+            for opcode, a, b, c in iter_program(puzzle_input_file)
+        ]
+    )
+    return execute(compiled, [0] * 4).registers
@@ -1,127 +1,485 @@
-from collections import defaultdict, namedtuple
-from copy import deepcopy
-from operator import itemgetter
+import bisect
+import re
+from collections import namedtuple
 
-Line = namedtuple("Line", ["x", "y"])
+import numpy as np
+
+# Cells hold the ASCII code of the character they print as
+SAND, CLAY, FLOWING, STILL, SOURCE = b".#|~+"
 WATER_SYMBOLS = ("+", "|", "~")
 SPRING = (500, 0)
-Grid = namedtuple("Grid", ["rows", "y_min", "y_max", "x_min", "x_max"])
-
-
-def parse_puzzle(puzzle_input_file, spring=SPRING):
-    grid = defaultdict(lambda: defaultdict(lambda: "."))
-    global_y_min = float("inf")
-    global_y_max = float("-inf")
-    global_x_min = float("inf")
-    global_x_max = float("-inf")
-    with open(puzzle_input_file, "r") as puzzle_input:
-        for line in puzzle_input:
-            line = line.strip().replace("=", "='").replace(",", "',")
-            line = eval(f"Line({line}')")
-            x_range = tuple(int(x) for x in line.x.split(".."))
-            x_min, x_max = (x_range[0], x_range[0]) if len(x_range) == 1 else x_range
-            y_range = tuple(int(y) for y in line.y.split(".."))
-            y_min, y_max = (y_range[0], y_range[0]) if len(y_range) == 1 else y_range
-            global_y_min = min(global_y_min, y_min)
-            global_y_max = max(global_y_max, y_max)
-            global_x_min = min(global_x_min, x_min)
-            global_x_max = max(global_x_max, x_max)
-            for y in range(y_min, y_max + 1):
-                for x in range(x_min, x_max + 1):
-                    grid[y][x] = "#"
-    grid[spring[1]][spring[0]] = "+"
-    global_x_max += 1
-    global_x_min -= 1
-    return Grid(grid, global_y_min, global_y_max, global_x_min, global_x_max)
+VEIN_PATTERN = re.compile(rb"([xy])=(\d+), *[xy]=(\d+)(?:\.\.(\d+))?")
+# ``cells`` is a dense uint8 array, and ``(x, y)`` is at
+# ``cells[y - y_offset, x - x_offset]``. ``tally[code]`` is how many cells in
+# the counted area, ``y_min`` to ``y_max`` and ``x_min`` to ``x_max``, hold
+# ``code``, and is kept up to date as water flows. ``basins`` remembers what
+# water falling in at a flat offset fills on its own, for fill_springs.
+Grid = namedtuple(
+    "Grid",
+    [
+        "cells",
+        "y_min",
+        "y_max",
+        "x_min",
+        "x_max",
+        "x_offset",
+        "y_offset",
+        "tally",
+        "basins",
+    ],
+)
+# What water falling in at a cell does on its own on the dry map: the last
+# cell it falls through, which is where it lands if there is clay underneath
+# and otherwise leads on to the next fall in the column or off the map, and
+# the flat offsets of the other cells it wets, what they hold and the cells
+# where it spills over an edge
+Basin = namedtuple("Basin", ["bottom", "offsets", "codes", "exits"])
+# Work items for flood_fill
+FALL, SPREAD = range(2)
+# How far along each cell is in getting wet, for merging fills
+WETNESS = np.zeros(256, dtype=np.int8)
+WETNESS[[FLOWING, SOURCE, STILL]] = [1, 2, 3]
+# How many bytes of cells drain goes through at a time, and how many cells
+# paint_cells and paint_basin work on at a time
+DRAIN_CHUNK_BYTES = 1 << 20
+PAINT_CHUNK = 1 << 16
+
+
+def parse_veins(data):
+    """Yield ``(x_min, x_max, y_min, y_max)`` for each vein of clay in ``data``."""
+    for match in VEIN_PATTERN.finditer(data):
+        axis, fixed, start, stop = match.groups()
+        fixed = int(fixed)
+        start = int(start)
+        stop = start if stop is None else int(stop)
+        if axis == b"x":
+            yield fixed, fixed, start, stop
+        else:
+            yield start, stop, fixed, fixed
+
+
+def parse_puzzle(puzzle_input_file, spring=SPRING, backing_file=None):
+    """
+    Read the clay veins into a dense grid covering them and ``spring``, with a
+    spare column on either side and a spare row underneath. ``backing_file``
+    memory-maps the grid to that path instead of keeping it in memory, for
+    very tall maps.
+    """
+    with open(puzzle_input_file, "rb") as puzzle_input:
+        veins = np.array(list(parse_veins(puzzle_input.read())), dtype=np.int64)
+    if not len(veins):
+        raise ValueError(f"No clay veins found in {puzzle_input_file}")
+    x_min = int(veins[:, 0].min()) - 1
+    x_max = int(veins[:, 1].max()) + 1
+    y_min = int(veins[:, 2].min())
+    y_max = int(veins[:, 3].max())
+    x_offset = min(x_min, spring[0]) - 1
+    y_offset = min(y_min, spring[1])
+    shape = (max(y_max, spring[1]) + 2 - y_offset, max(x_max, spring[0]) + 2 - x_offset)
+    if backing_file is None:
+        cells = np.full(shape, SAND, dtype=np.uint8)
+    else:
+        cells = np.memmap(backing_file, dtype=np.uint8, mode="w+", shape=shape)
+        cells.fill(SAND)
+    for vein_x_min, vein_x_max, vein_y_min, vein_y_max in veins.tolist():
+        cells[
+            vein_y_min - y_offset : vein_y_max + 1 - y_offset,
+            vein_x_min - x_offset : vein_x_max + 1 - x_offset,
+        ] = CLAY
+    cells[spring[1] - y_offset, spring[0] - x_offset] = SOURCE
+    grid = Grid(cells, y_min, y_max, x_min, x_max, x_offset, y_offset, [], {})
+    grid.tally.extend(tally_cells(grid))
+    return grid
+
+
+def tally_cells(grid):
+    """Count each kind of cell in the counted area in one vectorized pass."""
+    counted = grid.cells[
+        grid.y_min - grid.y_offset : grid.y_max + 1 - grid.y_offset,
+        grid.x_min - grid.x_offset : grid.x_max + 1 - grid.x_offset,
+    ]
+    return np.bincount(counted.ravel(), minlength=256).tolist()
 
 
 def print_grid(grid, spring=SPRING):
-    for y in range(min(grid.y_min, SPRING[1]), grid.y_max + 1):
-        row = grid.rows[y]
-        for x in range(min(grid.x_min, SPRING[0]), grid.x_max + 1):
-            print(row[x], end="")
+    x_start = min(grid.x_min, spring[0]) - grid.x_offset
+    x_stop = grid.x_max + 1 - grid.x_offset
+    for y in range(min(grid.y_min, spring[1]), grid.y_max + 1):
+        print(grid.cells[y - grid.y_offset, x_start:x_stop].tobytes().decode())
+
+
+def is_support(cell):
+    return cell == CLAY or cell == STILL
+
+
+def is_flowing(cell):
+    return cell == FLOWING or cell == SOURCE
+
+
+def spring_cell(grid, spring):
+    """The flat offset of ``spring`` into ``grid.cells``."""
+    height, width = grid.cells.shape
+    x = spring[0] - grid.x_offset
+    y = spring[1] - grid.y_offset
+    if not (0 < x < width - 1 and 0 <= y < height - 1):
+        raise ValueError(f"Spring {spring} is outside the map")
+    return y * width + x
+
+
+def flood_fill(
+    grid, springs=(SPRING,), spread=(), basins=None, exits=None, changed=None
+):
+    """
+    Fill ``grid`` with water from ``springs`` using an explicit stack of work,
+    starting with flowing water at the flat offsets in ``spread`` spreading
+    again.
+
+    Water falls until it lands on clay or still water, then spreads left and
+    right along that row. A row that is walled in on both sides settles into
+    still water, which gives the flowing water above it something new to
+    spread on or a newly held up wall, so those cells go back on the stack.
+    Each cell only changes state at most twice, and a row is only rescanned
+    when something under it settles.
+
+    With ``basins`` (see ``resolve_falls``), water that falls onto the cell
+    where one starts is poured down the rest of the way with ``pour``. With
+    ``exits``, water spilling over an edge is not followed, but where it would
+    fall is added to ``exits``, and ``changed`` logs the flat offset of every
+    cell set.
+    """
+    # Work on flat offsets into the cells, so up and down are +/- width
+    width = grid.cells.shape[1]
+    cells = memoryview(grid.cells.reshape(-1))
+    tally = grid.tally
+    first_row = grid.y_min - grid.y_offset
+    last_row = grid.y_max - grid.y_offset
+    first_column = grid.x_min - grid.x_offset
+    last_column = grid.x_max - grid.x_offset
+
+    def set_cell(cell, code):
+        row, column = divmod(cell, width)
+        if first_row <= row <= last_row and first_column <= column <= last_column:
+            tally[cells[cell]] -= 1
+            tally[code] += 1
+        cells[cell] = code
+        if changed is not None:
+            changed.append(cell)
+
+    last_row_start = (grid.y_max - grid.y_offset) * width
+    stack = [(SPREAD, cell) for cell in spread]
+    for spring in springs:
+        cell = spring_cell(grid, spring)
+        if cells[cell] == CLAY:
+            raise ValueError(f"Spring {spring} is inside clay")
+        set_cell(cell, SOURCE)
+        # A spring can spread out like any other flowing water
+        stack.append((SPREAD, cell))
+        stack.append((FALL, cell + width))
+    while stack:
+        action, cell = stack.pop()
+        if action == FALL:
+            while cell < last_row_start + width and cells[cell] == SAND:
+                if basins is not None and cell in basins:
+                    stack.extend(pour(grid, basins, cell))
+                    break
+                set_cell(cell, FLOWING)
+                if is_support(cells[cell + width]):
+                    stack.append((SPREAD, cell))
+                    break
+                cell += width
+            continue
+
+        if not is_flowing(cells[cell]) or not is_support(cells[cell + width]):
+            continue
+        ends = []
+        for step in (-1, 1):
+            end = cell
+            while is_support(cells[end + width]) and cells[end + step] != CLAY:
+                end += step
+            ends.append(end)
+        left, right = ends
+        # Only clay that is itself held up counts as a wall
+        walled = all(
+            is_support(cells[end + width]) and is_support(cells[end + step + width])
+            for end, step in zip(ends, (-1, 1))
+        )
+        if walled:
+            for settled in range(left, right + 1):
+                set_cell(settled, STILL)
+                above = cells[settled - width]
+                if is_flowing(above):
+                    stack.append((SPREAD, settled - width))
+                elif above == CLAY:
+                    # Clay above is now a wall for the water next to it
+                    for side in (settled - width - 1, settled - width + 1):
+                        if is_flowing(cells[side]):
+                            stack.append((SPREAD, side))
+            continue
+        for flowing in range(left, right + 1):
+            if cells[flowing] == SAND:
+                set_cell(flowing, FLOWING)
+        for end in ends:
+            if not is_support(cells[end + width]):
+                if exits is None:
+                    stack.append((FALL, end + width))
+                else:
+                    exits.append(end + width)
+
+
+def drain(grid):
+    """
+    Turn everything but clay back into sand, a chunk of rows at a time so a
+    memory-mapped grid is never copied whole.
+    """
+    cells = grid.cells
+    rows_per_chunk = max(DRAIN_CHUNK_BYTES // cells.shape[1], 1)
+    for start in range(0, cells.shape[0], rows_per_chunk):
+        chunk = cells[start : start + rows_per_chunk]
+        chunk[chunk != CLAY] = SAND
+    for code in (FLOWING, STILL, SOURCE):
+        grid.tally[SAND] += grid.tally[code]
+        grid.tally[code] = 0
+
+
+def paint_cells(grid, offsets, codes, wettest=False):
+    """
+    Set the flat ``offsets`` of ``grid.cells`` to ``codes`` and update the
+    tally, or with ``wettest``, only where that makes the cell wetter. Works a
+    chunk of ``PAINT_CHUNK`` cells at a time to keep the temporaries small.
+    """
+    flat_cells = grid.cells.reshape(-1)
+    codes = np.asarray(codes, dtype=np.uint8)
+    if codes.ndim == 0:
+        codes = np.broadcast_to(codes, offsets.shape)
+    for start in range(0, len(offsets), PAINT_CHUNK):
+        chunk = offsets[start : start + PAINT_CHUNK]
+        chunk_codes = codes[start : start + PAINT_CHUNK]
+        current = flat_cells[chunk]
+        if wettest:
+            chunk_codes = np.where(
+                WETNESS[chunk_codes] > WETNESS[current], chunk_codes, current
+            )
+        rows, columns = np.divmod(chunk, grid.cells.shape[1])
+        counted = (
+            (rows >= grid.y_min - grid.y_offset)
+            & (rows <= grid.y_max - grid.y_offset)
+            & (columns >= grid.x_min - grid.x_offset)
+            & (columns <= grid.x_max - grid.x_offset)
+        )
+        before = np.bincount(current[counted], minlength=256)
+        after = np.bincount(chunk_codes[counted], minlength=256)
+        flat_cells[chunk] = chunk_codes
+        for code in np.nonzero(before != after)[0].tolist():
+            grid.tally[code] += int(after[code] - before[code])
+
+
+def resolve_falls(grid, falls):
+    """
+    Work out what water falling in at each of the flat offsets in ``falls``
+    fills on its own on the dry ``grid``, down to where it spills over an edge,
+    and the same for wherever it spills, unless ``grid.basins`` has it already.
+
+    Water falling down a column that another fall starts further down hands
+    over to that one, and one starting below a fall that is already known
+    shares its basin, unless the water in the basin rises as high as the lower
+    start. So each stretch of a column is only searched for clay about once.
+    The grid is left dry again.
+    """
+    width = grid.cells.shape[1]
+    flat_cells = grid.cells.reshape(-1)
+    # Small offsets are enough for all but enormous grids
+    offset_type = np.min_scalar_type(flat_cells.size)
+    nothing = np.zeros(0, dtype=offset_type)
+    past_last_row = (grid.y_max - grid.y_offset + 1) * width
+    # The known starts in each column, top to bottom
+    columns = {}
+    for cell in sorted(grid.basins):
+        columns.setdefault(cell % width, []).append(cell)
+    pending = list(falls)
+    while pending:
+        cell = pending.pop()
+        if cell in grid.basins:
+            continue
+        starts = columns.setdefault(cell % width, [])
+        index = bisect.bisect(starts, cell)
+        stop = starts[index] if index < len(starts) else past_last_row
+        above = grid.basins[starts[index - 1]] if index else None
+        if above is not None and above.bottom >= cell:
+            if fills_past(above, cell, width):
+                # The water from higher up adds to the basin, but it can't be
+                # any further away
+                basin = fill_basin(grid, cell, above.bottom)
+            else:
+                basin = above
+        elif cell >= past_last_row or flat_cells[cell] == CLAY:
+            # Nothing falls from here
+            basin = Basin(cell, nothing, nothing, ())
+        else:
+            basin = None
+            # Search for clay underneath in growing runs of rows, so short
+            # falls are found quickly
+            rows = 64
+            start = cell
+            while basin is None and start < stop:
+                end = min(start + rows * width, stop)
+                clay = np.flatnonzero(
+                    flat_cells[start + width : end + width : width] == CLAY
+                )
+                if len(clay):
+                    basin = fill_basin(grid, cell, start + int(clay[0]) * width)
+                start = end
+                rows *= 2
+            below = grid.basins.get(stop)
+            if basin is None and below is not None and fills_past(below, stop, width):
+                # This water adds to the basin the next fall down fills, so
+                # handing over to it would lose some
+                basin = fill_basin(grid, cell, below.bottom)
+            elif basin is None:
+                # Off the bottom of the map, or into the next known fall
+                bottom = cell + (stop - cell - 1) // width * width
+                basin = Basin(bottom, nothing, nothing, ())
+        grid.basins[cell] = basin
+        bisect.insort(starts, cell)
+        pending.extend(basin.exits)
+
+
+def fills_past(basin, cell, width):
+    """Whether the water in ``basin`` rises as high as the flat offset ``cell``."""
+    return len(basin.offsets) > 0 and basin.offsets[0] // width <= cell // width
+
+
+def fill_basin(grid, cell, bottom):
+    """
+    Fill the dry ``grid`` from water falling from the flat offset ``cell`` to
+    land at ``bottom``, record everything but the fall as a ``Basin`` and dry
+    the grid out again.
+    """
+    width = grid.cells.shape[1]
+    flat_cells = grid.cells.reshape(-1)
+    offset_type = np.min_scalar_type(flat_cells.size)
+    column = np.arange(cell, bottom + 1, width, dtype=offset_type)
+    paint_cells(grid, column, FLOWING)
+    exits = []
+    changed = []
+    flood_fill(grid, springs=(), spread=(bottom,), exits=exits, changed=changed)
+    offsets = np.unique(np.array(changed, dtype=offset_type))
+    basin = Basin(bottom, offsets, flat_cells[offsets], tuple(dict.fromkeys(exits)))
+    paint_cells(grid, offsets, SAND)
+    paint_cells(grid, column, SAND)
+    return basin
+
+
+def pour(grid, basins, cell):
+    """
+    Let water fall from the flat offset ``cell``, where a ``Basin`` starts, down
+    the columns ``basins`` say it falls through, a column at a time, and
+    return the work left for flood_fill. Like falling a cell at a time, it
+    stops on reaching other water, and lands early on still water. If it lands
+    where the basin says, the basin is painted in with ``paint_basin``.
+    """
+    width = grid.cells.shape[1]
+    flat_cells = grid.cells.reshape(-1)
+    first_row = grid.y_min - grid.y_offset
+    last_row = grid.y_max - grid.y_offset
+    while True:
+        basin = basins[cell]
+        column = flat_cells[cell : basin.bottom + 1 : width]
+        under = flat_cells[cell + width : basin.bottom + width + 1 : width]
+        (wet,) = np.nonzero(column != SAND)
+        (held,) = np.nonzero((under == CLAY) | (under == STILL))
+        stop = int(wet[0]) if len(wet) else len(column)
+        landed = len(held) > 0 and held[0] < stop
+        if landed:
+            stop = int(held[0]) + 1
+        # All sand, so the tally just needs the number of counted cells
+        column[:stop] = FLOWING
+        row, x = divmod(cell, width)
+        if grid.x_min <= x + grid.x_offset <= grid.x_max:
+            counted = max(min(row + stop, last_row + 1) - max(row, first_row), 0)
+            grid.tally[SAND] -= counted
+            grid.tally[FLOWING] += counted
+        if landed:
+            last = cell + (stop - 1) * width
+            if last == basin.bottom:
+                return paint_basin(grid, basin)
+            return [(SPREAD, last)]
+        if stop < len(column) or basin.bottom + width not in basins:
+            # Into other water, or off the bottom of the map
+            return []
+        cell = basin.bottom + width
+
+
+def paint_basin(grid, basin):
+    """
+    Paint a ``Basin`` from ``resolve_falls`` onto ``grid``, keeping the wettest
+    state where it overlaps other water, and return the work for flood_fill
+    to carry on from: the flowing water where it touches other water, which
+    may have more to stand on now, and the falls it spills into. The water
+    where the fall landed spreads again too, since other water may hold up a
+    wall that was hanging in the air when the basin was worked out.
+    """
+    bottom, offsets, codes, exits = basin
+    flat_cells = grid.cells.reshape(-1)
+    width = grid.cells.shape[1]
+    # Offsets from a cell to itself and the eight cells around it
+    deltas = (np.arange(3)[:, None] * width + np.arange(3) - width - 1).ravel()
+    touching = []
+    # Nine neighbours each, so a ninth of a chunk at a time
+    for start in range(0, len(offsets), PAINT_CHUNK // 9):
+        chunk = offsets[start : start + PAINT_CHUNK // 9].astype(np.int64)
+        # Only a spring can be on the top row, and water never reaches the
+        # spare cells round the sides and bottom, so every neighbour exists
+        neighbors = chunk[:, None] + deltas
+        rows, columns = np.nonzero(WETNESS[flat_cells[neighbors]])
+        touching.append(chunk[rows])
+        touching.append(neighbors[rows, columns])
+    paint_cells(grid, offsets, codes, wettest=True)
+    touching = np.unique(np.concatenate(touching)) if touching else offsets[:0]
+    touching_codes = flat_cells[touching]
+    work = [(SPREAD, bottom)]
+    work.extend(
+        (SPREAD, cell)
+        for cell in touching[
+            (touching_codes == FLOWING) | (touching_codes == SOURCE)
+        ].tolist()
+    )
+    # Popped first, so spills are looked up before the touching water spreads
+    work.extend((FALL, cell) for cell in reversed(exits))
+    return work
+
+
+def fill_springs(grid, springs=(SPRING,)):
+    """
+    Drain ``grid`` and fill it with water from all of ``springs`` at once.
+
+    The water falling from each spring is worked out with ``resolve_falls``,
+    which keeps what each fall fills in ``grid.basins``, keyed by the flat
+    offset where the water falls in. So once any spring's water has fallen
+    through a cell, later runs on the same Grid, from any spring whose water
+    falls through it, paint the basins and falls below it back in instead of
+    flowing them again. Where they touch other water, the flowing water there
+    is spread again, since it may now have more to stand on.
+    """
+    springs = list(dict.fromkeys(springs))
+    drain(grid)
+    width = grid.cells.shape[1]
+    resolve_falls(grid, [spring_cell(grid, spring) + width for spring in springs])
+    flood_fill(grid, springs=springs, basins=grid.basins)
+
+
+def advance_water(grid, spring=SPRING, verbose=False, springs=None):
+    fill_springs(grid, springs=(spring,) if springs is None else springs)
+    if verbose:
+        print_grid(grid)
         print()
 
 
-def advance_water(grid, spring=SPRING, verbose=False):
-    y_min = min(grid.y_min, SPRING[1])
-    x_min = min(grid.x_min, SPRING[0])
-    y_max = max(grid.y_max, SPRING[1])
-    x_max = max(grid.x_max, SPRING[0])
-    iteration = 0
-    changed = True
-    prev_lowest_change = y_min
-    while changed:
-        iteration += 1
-        changed = False
-        lowest_change = None
-        # Set | when water is above
-        for y in range(prev_lowest_change, y_max + 1):
-            for x in range(x_min, x_max + 1):
-                curr = grid.rows[y][x]
-                if curr == "#":
-                    continue
-                above = grid.rows[y - 1][x]
-                below = grid.rows[y + 1][x]
-                left = grid.rows[y][x - 1]
-                right = grid.rows[y][x + 1]
-                if above in ("|", "+") and curr == ".":
-                    curr = grid.rows[y][x] = "|"
-                    if lowest_change is None:
-                        lowest_change = y
-                    changed = True
-                if below in ("#", "~") and curr in WATER_SYMBOLS:
-                    if left == ".":
-                        left = grid.rows[y][x - 1] = "|"
-                        changed = True
-                        if lowest_change is None:
-                            lowest_change = y
-                    if right == ".":
-                        right = grid.rows[y][x + 1] = "|"
-                        changed = True
-                        if lowest_change is None:
-                            lowest_change = y
-
-            # Scan for contained spots
-            left_wall_x = None
-            has_water = False
-            for x in range(grid.x_min, grid.x_max + 1):
-                below = grid.rows[y + 1][x]
-                curr = grid.rows[y][x]
-                if curr == "#" and below in ("#", "~"):
-                    if left_wall_x is not None:
-                        # actually found a left and right wall
-                        for contained_x in range(left_wall_x + 1, x):
-                            curr_contained = grid.rows[y][contained_x]
-                            if has_water and curr_contained != "~":
-                                grid.rows[y][contained_x] = "~"
-                                if lowest_change is None:
-                                    lowest_change = y
-                                changed = True
-                    left_wall_x = x
-                    has_water = False
-                elif below not in ("#", "~"):
-                    left_wall_x = None
-                if left_wall_x is not None and curr in WATER_SYMBOLS:
-                    has_water = True
-
-        prev_lowest_change = lowest_change - 1
-        if verbose:
-            print_grid(grid)
-            print()
-        elif iteration % 10 == 0:
-            print(iteration, end="\r")
-    print()
-
-
-def count_water_tiles(grid, still_only=False):
-    count = 0
-    for y in range(grid.y_min, grid.y_max + 1):
-        for x in range(grid.x_min, grid.x_max + 1):
-            curr = grid.rows[y][x]
-            if (not still_only and curr in WATER_SYMBOLS) or (
-                still_only and curr == "~"
-            ):
-                count += 1
-
-    return count
+def count_water_tiles(grid, still_only=False, recount=False):
+    """
+    Count the water in the counted area from the running tally, or with
+    ``recount``, by tallying the grid all over again to check it.
+    """
+    tally = tally_cells(grid) if recount else grid.tally
+    if still_only:
+        return tally[STILL]
+    return sum(tally[symbol] for symbol in "".join(WATER_SYMBOLS).encode())
@@ -1,7 +1,17 @@
-from collections import defaultdict, namedtuple
-from copy import deepcopy
-from concurrent.futures import ThreadPoolExecutor
-from operator import itemgetter
+import operator
+import weakref
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from hashlib import blake2b
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+OPEN, TREES, LUMBERYARD = range(3)
+SYMBOLS = ".|#"
+# bytes.translate tables between symbols and cell codes
+ENCODE_TABLE = bytes(SYMBOLS.find(chr(byte)) % 256 for byte in range(256))
+DECODE_TABLE = SYMBOLS.encode().ljust(256, b"?")
 
 
 def parse_puzzle(puzzle_input_file):
@@ -11,70 +21,855 @@ def parse_puzzle(puzzle_input_file):
 
 
 def print_grid(grid):
+    if isinstance(grid, np.ndarray):
+        grid = decode_grid(grid)
     for row in grid:
         print("".join(row))
     print()
 
 
-def advance_tile(args):
-    grid, x, y, num_rows, num_cols = args
-    new_val = grid[y][x]
-    surrounding = "".join(
-        grid[y + y_delta][x + x_delta]
-        for y_delta in (-1, 0, 1)
-        for x_delta in (-1, 0, 1)
-        if not (x_delta == y_delta == 0)
-        and 0 <= x + x_delta < num_cols
-        and 0 <= y + y_delta < num_rows
+def encode_grid(grid):
+    """Convert a tuple-of-tuples grid into an int8 array of cell codes."""
+    num_cols = len(grid[0]) if grid else 0
+    data = "".join("".join(row) for row in grid).encode().translate(ENCODE_TABLE)
+    cells = np.frombuffer(data, dtype=np.int8).reshape(len(grid), num_cols)
+    if (cells < 0).any():
+        raise ValueError(f"Grid contains symbols other than {SYMBOLS!r}")
+    return cells.copy()
+
+
+def decode_grid(cells):
+    """Convert an int8 array of cell codes back into a tuple-of-tuples grid."""
+    return tuple(
+        tuple(row.tobytes().translate(DECODE_TABLE).decode())
+        for row in cells.astype(np.uint8)
     )
-    if new_val == "." and surrounding.count("|") >= 3:
-        new_val = "|"
-    elif new_val == "|" and surrounding.count("#") >= 3:
-        new_val = "#"
-    elif new_val == "#" and ("#" not in surrounding or "|" not in surrounding):
-        new_val = "."
-    return new_val
-
-
-def advance(grid, executor, minutes=10, verbose=False):
-    num_rows = len(grid)
-    num_cols = len(grid[0])
-    if verbose:
-        print("Initial grid")
-        print_grid(grid)
-    grids_to_minutes = {}
-    minutes_to_grids = {}
-    for minute in range(1, minutes + 1):
-        if grid not in grids_to_minutes:
-            grids_to_minutes[grid] = minute
-            minutes_to_grids[minute] = grid
-            grid = tuple(
-                tuple(
-                    executor.map(
-                        advance_tile,
-                        ((grid, x, row, num_rows, num_cols) for x in range(num_cols)),
+
+
+def count_neighbors(mask):
+    """Count how many of the eight neighbors of each cell are set in ``mask``."""
+    num_rows, num_cols = mask.shape
+    padded = np.pad(mask.astype(np.int8), 1)
+    counts = np.zeros(mask.shape, dtype=np.int8)
+    for y_delta in range(3):
+        for x_delta in range(3):
+            if y_delta == x_delta == 1:
+                continue
+            counts += padded[y_delta : y_delta + num_rows, x_delta : x_delta + num_cols]
+    return counts
+
+
+def step(cells):
+    """Advance an array of cell codes by one minute."""
+    trees = cells == TREES
+    lumberyards = cells == LUMBERYARD
+    num_trees = count_neighbors(trees)
+    num_lumberyards = count_neighbors(lumberyards)
+    new_cells = cells.copy()
+    new_cells[(cells == OPEN) & (num_trees >= 3)] = TREES
+    new_cells[trees & (num_lumberyards >= 3)] = LUMBERYARD
+    new_cells[lumberyards & ((num_lumberyards == 0) | (num_trees == 0))] = OPEN
+    return new_cells
+
+
+def grid_digest(cells):
+    """A 128-bit fingerprint of the grid's bytes."""
+    return blake2b(cells.tobytes(), digest_size=16).digest()
+
+
+# A grid as one big int per plane, with bit ``y * (num_cols + 1) + x`` set if
+# ``(x, y)`` has trees or a lumberyard. The spare bit at the end of each row is
+# always clear, so shifting by one never carries a cell into the next row.
+Bitboard = namedtuple("Bitboard", ["trees", "lumberyards", "num_rows", "num_cols"])
+
+
+@lru_cache(maxsize=None)
+def bitboard_mask(num_rows, num_cols):
+    """Every cell bit of a bitboard, leaving out the spare bit on each row."""
+    stride = num_cols + 1
+    # One bit at the start of every row, times a whole row of bits
+    row_starts = ((1 << (stride * num_rows)) - 1) // ((1 << stride) - 1)
+    return row_starts * ((1 << num_cols) - 1)
+
+
+def pack_bitboard(cells):
+    num_rows, num_cols = cells.shape
+    planes = []
+    for code in (TREES, LUMBERYARD):
+        # Add the spare column before flattening the rows into one int
+        bits = np.pad(cells == code, ((0, 0), (0, 1)))
+        data = np.packbits(bits, bitorder="little").tobytes()
+        planes.append(int.from_bytes(data, "little"))
+    return Bitboard(*planes, num_rows, num_cols)
+
+
+def unpack_bitboard(board):
+    num_bits = board.num_rows * (board.num_cols + 1)
+    cells = np.full((board.num_rows, board.num_cols), OPEN, dtype=np.int8)
+    for code, plane in ((TREES, board.trees), (LUMBERYARD, board.lumberyards)):
+        data = np.frombuffer(plane.to_bytes((num_bits + 7) // 8, "little"), np.uint8)
+        bits = np.unpackbits(data, count=num_bits, bitorder="little")
+        cells[bits.reshape(board.num_rows, -1)[:, : board.num_cols] == 1] = code
+    return cells
+
+
+def count_neighbor_bits(plane, stride):
+    """
+    Count the neighbors of every cell set in ``plane`` at once, with adders
+    working on every bit in parallel. Returns the ones, twos, fours and eights
+    bits of each count, as planes.
+    """
+    neighbors = [
+        plane << shift if shift > 0 else plane >> -shift
+        for shift in (
+            1,
+            -1,
+            stride - 1,
+            stride,
+            stride + 1,
+            -stride + 1,
+            -stride,
+            -stride - 1,
+        )
+    ]
+
+    def full_adder(a, b, c):
+        partial = a ^ b
+        return partial ^ c, (a & b) | (partial & c)
+
+    ones_a, twos_a = full_adder(*neighbors[0:3])
+    ones_b, twos_b = full_adder(*neighbors[3:6])
+    ones_c, twos_c = neighbors[6] ^ neighbors[7], neighbors[6] & neighbors[7]
+    ones, twos_d = full_adder(ones_a, ones_b, ones_c)
+    twos_e, fours_a = full_adder(twos_a, twos_b, twos_c)
+    twos, fours_b = twos_e ^ twos_d, twos_e & twos_d
+    return ones, twos, fours_a ^ fours_b, fours_a & fours_b
+
+
+def step_bitboard(board):
+    """Advance a ``Bitboard`` by one minute."""
+    trees, lumberyards, num_rows, num_cols = board
+    stride = num_cols + 1
+    tree_counts = count_neighbor_bits(trees, stride)
+    lumberyard_counts = count_neighbor_bits(lumberyards, stride)
+    ones, twos, fours, eights = tree_counts
+    three_trees = (ones & twos) | fours | eights
+    any_trees = ones | twos | fours | eights
+    ones, twos, fours, eights = lumberyard_counts
+    three_lumberyards = (ones & twos) | fours | eights
+    any_lumberyards = ones | twos | fours | eights
+    open_acres = bitboard_mask(num_rows, num_cols) & ~(trees | lumberyards)
+    return Bitboard(
+        (open_acres & three_trees) | (trees & ~three_lumberyards),
+        (trees & three_lumberyards) | (lumberyards & any_lumberyards & any_trees),
+        num_rows,
+        num_cols,
+    )
+
+
+def bitboard_digest(board):
+    """A 128-bit fingerprint of the packed planes."""
+    num_bytes = (board.num_rows * (board.num_cols + 1) + 7) // 8
+    digest = blake2b(digest_size=16)
+    digest.update(board.trees.to_bytes(num_bytes, "little"))
+    digest.update(board.lumberyards.to_bytes(num_bytes, "little"))
+    return digest.digest()
+
+
+class ActiveBuffer:
+    """
+    A grid with a border of open acres around it, that a chain of
+    ``ActiveGrid`` steps updates in place. Each step records the codes it
+    overwrote for as long as an older grid of the chain is still around, so
+    that grid can be rebuilt if it is used again, as the tortoise in
+    ``find_repeat_brent`` is. The buffer of a freshly packed grid is
+    ``shared``, as whoever packed it tends to keep it, so stepping that grid
+    starts a new buffer instead.
+    """
+
+    def __init__(self, cells, shared=False):
+        self.cells = cells
+        self.generation = 0
+        self.shared = shared
+        # undo[generation] turns the cells of generation + 1 back into those
+        # of generation, for every generation from undo_start on
+        self.undo = {}
+        self.undo_start = 0
+        self.grids = weakref.WeakValueDictionary()
+
+
+class ActiveGrid:
+    """
+    The cells of ``buffer`` as of ``generation`` steps into it, and the flat
+    indices of the cells that changed in the last minute. Only those and
+    their neighbors can change in the next one. ``digest`` is the XOR of a
+    random key for the code of every cell, so it can be kept up to date one
+    changed cell at a time.
+    """
+
+    __slots__ = ("buffer", "generation", "changed", "digest", "__weakref__")
+
+    def __init__(self, buffer, generation, changed, digest):
+        self.buffer = buffer
+        self.generation = generation
+        self.changed = changed
+        self.digest = digest
+        buffer.grids[generation] = self
+
+    @property
+    def cells(self):
+        """The bordered cells, rebuilt from the buffer if it has moved on."""
+        buffer = self.buffer
+        if self.generation == buffer.generation:
+            return buffer.cells
+        cells = buffer.cells.copy()
+        flat_cells = cells.reshape(-1)
+        for generation in range(buffer.generation - 1, self.generation - 1, -1):
+            changed, old_codes = buffer.undo[generation]
+            flat_cells[changed] = old_codes
+        return cells
+
+
+# Sweep the whole grid once the neighborhoods of the changed cells cover this
+# fraction of it. Gathering neighbors cell by cell costs enough more than
+# sweeping that this pays off well before most of the grid is active.
+ACTIVE_FULL_SWEEP = 0.05
+
+
+@lru_cache(maxsize=None)
+def active_offsets(num_cols):
+    """Flat offsets to the eight neighbors of a cell in a bordered grid."""
+    stride = num_cols + 2
+    return np.array(
+        [
+            y_delta * stride + x_delta
+            for y_delta in (-1, 0, 1)
+            for x_delta in (-1, 0, 1)
+            if y_delta or x_delta
+        ]
+    )
+
+
+@lru_cache(maxsize=None)
+def active_keys(num_rows, num_cols):
+    """
+    Random digest keys for each code in each cell of a bordered grid, with
+    the border's keys zeroed, and a flat mask of the cells inside it.
+    """
+    shape = (num_rows + 2, num_cols + 2)
+    inside = np.zeros(shape, dtype=bool)
+    inside[1:-1, 1:-1] = True
+    rng = np.random.default_rng(18)
+    keys = rng.integers(0, 1 << 64, (3, *shape), dtype=np.uint64, endpoint=False)
+    keys[:, ~inside] = 0
+    return keys.reshape(3, -1), inside.ravel()
+
+
+def pack_active(cells):
+    num_rows, num_cols = cells.shape
+    keys, inside = active_keys(num_rows, num_cols)
+    padded = np.pad(cells, 1, constant_values=OPEN)
+    codes = padded.ravel()
+    # Every cell counts as changed, so the first step is a full sweep
+    digest = np.bitwise_xor.reduce(keys[codes, np.arange(codes.size)])
+    return ActiveGrid(
+        ActiveBuffer(padded, shared=True), 0, np.flatnonzero(inside), int(digest)
+    )
+
+
+def unpack_active(grid):
+    return grid.cells[1:-1, 1:-1].copy()
+
+
+def step_active(grid):
+    """
+    Advance an ``ActiveGrid`` by one minute, re-evaluating only the cells
+    next to one that changed, or every cell with ``step`` if most of them are.
+    The cells are updated in place, so a step costs as much as the activity,
+    not the area, unless the grid is not the latest of its buffer.
+    """
+    buffer = grid.buffer
+    if buffer.shared or grid.generation != buffer.generation:
+        cells = grid.cells
+        buffer = ActiveBuffer(cells.copy() if cells is buffer.cells else cells)
+    num_rows, num_cols = (size - 2 for size in buffer.cells.shape)
+    keys, inside = active_keys(num_rows, num_cols)
+    codes = buffer.cells.reshape(-1)
+    if len(grid.changed) * 9 >= ACTIVE_FULL_SWEEP * num_rows * num_cols:
+        interior = buffer.cells[1:-1, 1:-1]
+        new_interior = step(interior)
+        rows, cols = np.nonzero(new_interior != interior)
+        changed = (rows + 1) * (num_cols + 2) + cols + 1
+        new_changed_codes = new_interior[rows, cols]
+    else:
+        offsets = active_offsets(num_cols)
+        candidates = np.unique(
+            np.concatenate([grid.changed, (grid.changed[:, None] + offsets).ravel()])
+        )
+        candidates = candidates[inside[candidates]]
+        neighbors = codes[candidates[:, None] + offsets]
+        num_trees = np.count_nonzero(neighbors == TREES, axis=1)
+        num_lumberyards = np.count_nonzero(neighbors == LUMBERYARD, axis=1)
+        old_codes = codes[candidates]
+        new_codes = old_codes.copy()
+        new_codes[(old_codes == OPEN) & (num_trees >= 3)] = TREES
+        new_codes[(old_codes == TREES) & (num_lumberyards >= 3)] = LUMBERYARD
+        new_codes[
+            (old_codes == LUMBERYARD) & ((num_lumberyards == 0) | (num_trees == 0))
+        ] = OPEN
+        moved = new_codes != old_codes
+        changed = candidates[moved]
+        new_changed_codes = new_codes[moved]
+    old_changed_codes = codes[changed]
+    digest = np.uint64(grid.digest)
+    digest ^= np.bitwise_xor.reduce(keys[old_changed_codes, changed])
+    digest ^= np.bitwise_xor.reduce(keys[new_changed_codes, changed])
+
+    buffer.undo[buffer.generation] = (changed, old_changed_codes)
+    codes[changed] = new_changed_codes
+    buffer.generation += 1
+    # Forget the changes that no grid still around can need
+    oldest = min(buffer.grids.keys(), default=buffer.generation)
+    while buffer.undo_start < oldest:
+        buffer.undo.pop(buffer.undo_start, None)
+        buffer.undo_start += 1
+    return ActiveGrid(buffer, buffer.generation, changed, int(digest))
+
+
+def active_equal(a, b):
+    return a.digest == b.digest and np.array_equal(a.cells, b.cells)
+
+
+# How advance_cells runs on a particular representation of the grid: packing
+# an array of cell codes into it and back, stepping it, fingerprinting it and
+# comparing two of them
+Engine = namedtuple("Engine", ["pack", "unpack", "step", "digest", "equal"])
+ENGINES = {
+    "numpy": Engine(np.copy, np.copy, step, grid_digest, np.array_equal),
+    "bitboard": Engine(
+        pack_bitboard, unpack_bitboard, step_bitboard, bitboard_digest, operator.eq
+    ),
+    "active": Engine(
+        pack_active,
+        unpack_active,
+        step_active,
+        operator.attrgetter("digest"),
+        active_equal,
+    ),
+}
+
+
+# The shared double buffer, as seen from inside a StripedStepper worker
+STRIPE_MEMORY = None
+STRIPE_BUFFERS = None
+
+
+def attach_stripe_buffers(name, shape):
+    global STRIPE_MEMORY, STRIPE_BUFFERS
+    STRIPE_MEMORY = shared_memory.SharedMemory(name=name)
+    STRIPE_BUFFERS = np.ndarray(shape, dtype=np.int8, buffer=STRIPE_MEMORY.buf)
+
+
+def step_stripe(args):
+    """
+    Step rows ``start`` to ``stop`` of buffer ``source`` into the other buffer,
+    reading the row on either side of the stripe from its neighbors as a
+    halo, and return the digest of the new stripe.
+    """
+    source, start, stop = args
+    num_rows = STRIPE_BUFFERS.shape[1]
+    top = max(start - 1, 0)
+    stepped = step(STRIPE_BUFFERS[source, top : min(stop + 1, num_rows)])
+    STRIPE_BUFFERS[1 - source, start:stop] = stepped[start - top : stop - top]
+    return grid_digest(STRIPE_BUFFERS[1 - source, start:stop])
+
+
+# A grid stepped by a StripedStepper, with the digest its stripes combine to
+StripedGrid = namedtuple("StripedGrid", ["cells", "digest"])
+
+
+class StripedStepper:
+    """
+    Steps grids in horizontal stripes, one per process in a pool. The grid
+    lives in a ``multiprocessing.shared_memory`` double buffer, so each minute
+    every worker reads its stripe and the halo rows around it from one buffer
+    and writes its new stripe to the other. Use it as a context manager, and
+    call ``engine()`` for an ``Engine`` to pass to ``find_repeat``.
+    """
+
+    def __init__(self, num_rows, num_cols, processes):
+        shape = (2, num_rows, num_cols)
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=max(2 * num_rows * num_cols, 1)
+        )
+        self.buffers = np.ndarray(shape, dtype=np.int8, buffer=self.memory.buf)
+        bounds = np.linspace(0, num_rows, min(processes, num_rows) + 1).astype(int)
+        self.stripes = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+        self.latest = None
+        self.latest_buffer = 0
+        self.pool = Pool(
+            processes,
+            initializer=attach_stripe_buffers,
+            initargs=(self.memory.name, shape),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.pool.terminate()
+        self.pool.join()
+        del self.buffers
+        self.memory.close()
+        self.memory.unlink()
+
+    def combine_digests(self, stripe_digests):
+        return blake2b(b"".join(stripe_digests), digest_size=16).digest()
+
+    def pack(self, cells):
+        stripe_digests = [
+            grid_digest(cells[start:stop]) for start, stop in self.stripes
+        ]
+        return StripedGrid(cells.copy(), self.combine_digests(stripe_digests))
+
+    def step(self, grid):
+        if grid is self.latest:
+            # Still in the buffer it was stepped into
+            source = self.latest_buffer
+        else:
+            source = 0
+            self.buffers[source] = grid.cells
+        stripe_digests = self.pool.map(
+            step_stripe, [(source, start, stop) for start, stop in self.stripes]
+        )
+        self.latest_buffer = 1 - source
+        self.latest = StripedGrid(
+            self.buffers[self.latest_buffer].copy(),
+            self.combine_digests(stripe_digests),
+        )
+        return self.latest
+
+    def engine(self):
+        return Engine(
+            self.pack,
+            lambda grid: grid.cells.copy(),
+            self.step,
+            lambda grid: grid.digest,
+            lambda a, b: a.digest == b.digest and np.array_equal(a.cells, b.cells),
+        )
+
+
+# Cells past the edge of the grid in a quadtree. They never change and count
+# as neither trees nor lumberyards, as if nothing was there.
+OUTSIDE = 3
+
+
+def next_cell(code, num_trees, num_lumberyards):
+    if code == OPEN and num_trees >= 3:
+        return TREES
+    if code == TREES and num_lumberyards >= 3:
+        return LUMBERYARD
+    if code == LUMBERYARD and (num_trees == 0 or num_lumberyards == 0):
+        return OPEN
+    return code
+
+
+class Node:
+    """
+    A square of ``2 ** level`` by ``2 ** level`` cells, split into four
+    quadrants that are nodes one level down, or cell codes at level 1. Nodes
+    are hash-consed by a ``QuadTree``, so they hash and compare by identity,
+    and ``futures`` memoizes ``QuadTree.future`` for each number of minutes.
+    """
+
+    __slots__ = ("nw", "ne", "sw", "se", "level", "hash", "futures")
+
+    def __init__(self, nw, ne, sw, se):
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self.level = nw.level + 1 if isinstance(nw, Node) else 1
+        self.hash = hash((nw, ne, sw, se))
+        self.futures = {}
+
+    def __hash__(self):
+        return self.hash
+
+
+class QuadTree:
+    """
+    Hashlife for the lumber collection area. Grids are stored as quadtrees
+    of canonical nodes, so every distinct block exists once however often it
+    appears in the grid or over time, and each node remembers the block in
+    its middle ``2 ** j`` minutes on. Jumping a grid forward then only steps
+    the blocks that have not been seen before.
+
+    At most ``cache_size`` nodes are kept canonical, evicting the least
+    recently used. An evicted node stays valid wherever it is still
+    referenced, but forgets its futures and is no longer shared.
+    """
+
+    def __init__(self, cache_size=1 << 20):
+        self.cache_size = cache_size
+        self.nodes = OrderedDict()
+        self.empty_nodes = [OUTSIDE]
+
+    def node(self, nw, ne, sw, se):
+        key = (nw, ne, sw, se)
+        node = self.nodes.get(key)
+        if node is not None:
+            self.nodes.move_to_end(key)
+            return node
+        node = self.nodes[key] = Node(nw, ne, sw, se)
+        if len(self.nodes) > self.cache_size:
+            _, evicted = self.nodes.popitem(last=False)
+            evicted.futures.clear()
+        return node
+
+    def empty(self, level):
+        """A node of ``level`` that is all outside the grid."""
+        while len(self.empty_nodes) <= level:
+            quadrant = self.empty_nodes[-1]
+            self.empty_nodes.append(self.node(quadrant, quadrant, quadrant, quadrant))
+        return self.empty_nodes[level]
+
+    def center(self, node):
+        return self.node(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def expand(self, node):
+        """Surround ``node`` with a border of outside cells half its width."""
+        border = self.empty(node.level - 1)
+        return self.node(
+            self.node(border, border, border, node.nw),
+            self.node(border, border, node.ne, border),
+            self.node(border, node.sw, border, border),
+            self.node(node.se, border, border, border),
+        )
+
+    def step_leaves(self, node):
+        """The middle 2x2 cells of a level 2 node after one minute."""
+        rows = (
+            (node.nw.nw, node.nw.ne, node.ne.nw, node.ne.ne),
+            (node.nw.sw, node.nw.se, node.ne.sw, node.ne.se),
+            (node.sw.nw, node.sw.ne, node.se.nw, node.se.ne),
+            (node.sw.sw, node.sw.se, node.se.sw, node.se.se),
+        )
+        new_cells = []
+        for y in (1, 2):
+            for x in (1, 2):
+                neighbors = [
+                    rows[y + y_delta][x + x_delta]
+                    for y_delta in (-1, 0, 1)
+                    for x_delta in (-1, 0, 1)
+                    if y_delta or x_delta
+                ]
+                new_cells.append(
+                    next_cell(
+                        rows[y][x],
+                        neighbors.count(TREES),
+                        neighbors.count(LUMBERYARD),
                     )
                 )
-                for row in range(num_rows)
-            )
-            if verbose:
-                print(f"After minute {minute}")
-                print_grid(grid)
-        # found repeat point, just use previous grid that will match end point
+        return self.node(*new_cells)
+
+    def future(self, node, j):
+        """
+        The middle half of ``node`` after ``2 ** j`` minutes. ``j`` can be at
+        most ``node.level - 2``, as nothing further out than that can reach
+        the middle in time.
+        """
+        future = node.futures.get(j)
+        if future is not None:
+            return future
+        if node.level == 2:
+            future = self.step_leaves(node)
         else:
-            print(f"Found repeat of {grids_to_minutes[grid]} at {minute}")
-            cycle_start = grids_to_minutes[grid]
-            cycle_length = minute - cycle_start
-            final_grid_idx = cycle_start + ((minutes - cycle_start + 1) % cycle_length)
-            print(f"Predicting {final_grid_idx} as final grid")
-            grid = minutes_to_grids[final_grid_idx]
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            # Nine overlapping blocks a quarter of the size of node
+            blocks = (
+                nw,
+                self.node(nw.ne, ne.nw, nw.se, ne.sw),
+                ne,
+                self.node(nw.sw, nw.se, sw.nw, sw.ne),
+                self.center(node),
+                self.node(ne.sw, ne.se, se.nw, se.ne),
+                sw,
+                self.node(sw.ne, se.nw, sw.se, se.sw),
+                se,
+            )
+            if j == node.level - 2:
+                # Go half of the way in the blocks, then the rest in the four
+                # blocks they overlap into
+                inner_j = j - 1
+                a, b, c, d, e, f, g, h, i = (
+                    self.future(block, inner_j) for block in blocks
+                )
+            else:
+                inner_j = j
+                a, b, c, d, e, f, g, h, i = (self.center(block) for block in blocks)
+            future = self.node(
+                self.future(self.node(a, b, d, e), inner_j),
+                self.future(self.node(b, c, e, f), inner_j),
+                self.future(self.node(d, e, g, h), inner_j),
+                self.future(self.node(e, f, h, i), inner_j),
+            )
+        node.futures[j] = future
+        return future
+
+    def build(self, cells):
+        """
+        A node with ``cells`` inside its middle half, and the offset of their
+        top left corner from its own.
+        """
+        num_rows, num_cols = cells.shape
+        level = 2
+        while 1 << (level - 1) < max(num_rows, num_cols):
+            level += 1
+        offset = 1 << (level - 2)
+        rows = cells.tolist()
+
+        def build_block(level, y, x):
+            size = 1 << level
+            if (
+                y + size <= offset
+                or x + size <= offset
+                or y >= offset + num_rows
+                or x >= offset + num_cols
+            ):
+                return self.empty(level)
+            if level == 0:
+                return rows[y - offset][x - offset]
+            half = size >> 1
+            return self.node(
+                build_block(level - 1, y, x),
+                build_block(level - 1, y, x + half),
+                build_block(level - 1, y + half, x),
+                build_block(level - 1, y + half, x + half),
+            )
+
+        return build_block(level, 0, 0), offset
+
+    def cells(self, node, offset, shape):
+        """The ``shape`` cells at ``offset`` in ``node``, as an array."""
+        num_rows, num_cols = shape
+        cells = np.zeros(shape, dtype=np.int8)
+
+        def fill_block(node, y, x):
+            size = 1 << node.level
+            if (
+                y + size <= offset
+                or x + size <= offset
+                or y >= offset + num_rows
+                or x >= offset + num_cols
+            ):
+                return
+            half = size >> 1
+            for quadrant, y_quadrant, x_quadrant in (
+                (node.nw, y, x),
+                (node.ne, y, x + half),
+                (node.sw, y + half, x),
+                (node.se, y + half, x + half),
+            ):
+                if node.level > 1:
+                    fill_block(quadrant, y_quadrant, x_quadrant)
+                elif (
+                    offset <= y_quadrant < offset + num_rows
+                    and offset <= x_quadrant < offset + num_cols
+                ):
+                    cells[y_quadrant - offset, x_quadrant - offset] = quadrant
+
+        fill_block(node, 0, 0)
+        return cells
+
+    def advance(self, cells, minutes):
+        """
+        Advance an array of cell codes by ``minutes``, in one jump of
+        ``2 ** j`` minutes for every bit ``j`` set in it.
+        """
+        node, offset = self.build(cells)
+        j = 0
+        while minutes:
+            if minutes & 1:
+                while node.level < j + 2:
+                    node = self.expand(node)
+                    offset += 1 << (node.level - 2)
+                # The future loses a border as wide as the one expand adds,
+                # so the grid stays at the same offset
+                node = self.expand(self.future(node, j))
+            minutes >>= 1
+            j += 1
+        return self.cells(node, offset, cells.shape)
+
+
+def step_cells(cells, minutes, engine=ENGINES["numpy"]):
+    for _ in range(minutes):
+        cells = engine.step(cells)
+    return cells
+
+
+def find_repeat(cells, minutes, verbose=False, engine=ENGINES["numpy"]):
+    """
+    Step ``cells`` until a grid repeats, remembering only a digest of each grid.
+    When a digest comes up again, the earlier grid is rebuilt from ``cells``
+    and compared in full, to rule out a collision.
+
+    Returns ``(cycle_start, cycle_length, grid)``, where the grid after
+    ``cycle_start`` minutes comes back every ``cycle_length`` minutes and
+    ``grid`` is the grid after ``cycle_start + cycle_length`` minutes.
+    ``cycle_length`` is ``None`` if nothing repeats within ``minutes``, in
+    which case ``grid`` is the grid after ``minutes``.
+    """
+    digests_to_minutes = {}
+    grid = cells
+    for minute in range(minutes + 1):
+        digest = engine.digest(grid)
+        seen_at = digests_to_minutes.get(digest)
+        if seen_at is not None and engine.equal(
+            step_cells(cells, seen_at, engine=engine), grid
+        ):
+            return seen_at, minute - seen_at, grid
+        digests_to_minutes[digest] = minute
+        if minute < minutes:
+            grid = engine.step(grid)
             if verbose:
-                print(f"After minute {minutes}")
-                print_grid(grid)
-            break
-    return grid
+                print(f"After minute {minute + 1}")
+                print_grid(engine.unpack(grid))
+    return minutes, None, grid
+
+
+def find_repeat_brent(cells, minutes, engine=ENGINES["numpy"]):
+    """
+    Like ``find_repeat``, but with Brent's algorithm, so only a couple of
+    grids are kept in memory at once, at the cost of stepping further.
+    """
+    if not minutes:
+        return minutes, None, cells
+    # Find the cycle length, looking for the hare at each power of two
+    power = cycle_length = 1
+    tortoise = cells
+    hare = engine.step(cells)
+    hare_minute = 1
+    while not engine.equal(tortoise, hare):
+        if hare_minute == minutes:
+            return minutes, None, hare
+        if power == cycle_length:
+            tortoise = hare
+            power *= 2
+            cycle_length = 0
+        hare = engine.step(hare)
+        hare_minute += 1
+        cycle_length += 1
+    # Then start the hare a cycle ahead of the tortoise to find where it begins
+    tortoise = cells
+    hare = step_cells(cells, cycle_length, engine=engine)
+    cycle_start = 0
+    while not engine.equal(tortoise, hare):
+        tortoise = engine.step(tortoise)
+        hare = engine.step(hare)
+        cycle_start += 1
+    return cycle_start, cycle_length, hare
+
+
+def advance_cells(
+    cells,
+    minutes=10,
+    verbose=False,
+    cycle_detection="digest",
+    engine="numpy",
+    processes=None,
+    cache_size=1 << 20,
+):
+    """
+    Advance an array of cell codes by ``minutes``, skipping ahead once the
+    grid starts repeating. ``cycle_detection`` is either ``"digest"``, which
+    remembers a 128-bit digest of every grid seen, or ``"brent"``, which
+    keeps a constant number of grids at the cost of stepping further.
+    ``engine`` names the entry of ``ENGINES`` that does the stepping, or with
+    ``processes``, the NumPy kernel runs on that many stripes of the grid in
+    parallel with a ``StripedStepper``.
+
+    The ``"hashlife"`` engine needs no repeat of the whole grid, and jumps
+    straight to the end with a ``QuadTree`` of at most ``cache_size`` nodes.
+    """
+    if engine == "hashlife":
+        if processes is not None:
+            raise ValueError("The hashlife engine runs on a single process")
+        if verbose:
+            print("Initial grid")
+            print_grid(cells)
+        cells = QuadTree(cache_size).advance(cells, minutes)
+        if verbose:
+            print(f"After minute {minutes}")
+            print_grid(cells)
+        return cells
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'")
+    if processes is None:
+        return run_engine(cells, minutes, verbose, cycle_detection, ENGINES[engine])
+    if engine != "numpy":
+        raise ValueError("Only the numpy engine can run on multiple processes")
+    with StripedStepper(*cells.shape, processes) as stepper:
+        return run_engine(cells, minutes, verbose, cycle_detection, stepper.engine())
+
+
+def run_engine(cells, minutes, verbose, cycle_detection, engine):
+    if verbose:
+        print("Initial grid")
+        print_grid(cells)
+    grid = engine.pack(cells)
+    if cycle_detection == "digest":
+        cycle_start, cycle_length, grid = find_repeat(
+            grid, minutes, verbose=verbose, engine=engine
+        )
+    elif cycle_detection == "brent":
+        cycle_start, cycle_length, grid = find_repeat_brent(
+            grid, minutes, engine=engine
+        )
+    else:
+        raise ValueError(f"Unknown cycle detection method '{cycle_detection}'")
+    if cycle_length is not None:
+        print(f"Found repeat of minute {cycle_start} every {cycle_length} minutes")
+        # grid is the grid after cycle_start + cycle_length minutes, which is
+        # also the grid after cycle_start minutes
+        grid = step_cells(grid, (minutes - cycle_start) % cycle_length, engine=engine)
+        if verbose:
+            print(f"After minute {minutes}")
+            print_grid(engine.unpack(grid))
+    return engine.unpack(grid)
+
+
+def advance(
+    grid,
+    processes=None,
+    minutes=10,
+    verbose=False,
+    cycle_detection="digest",
+    engine="numpy",
+    cache_size=1 << 20,
+):
+    """
+    Advance a tuple-of-tuples grid by ``minutes`` with one of the ``ENGINES``
+    or ``"hashlife"``, split across ``processes`` worker processes if given.
+    """
+    cells = advance_cells(
+        encode_grid(grid),
+        minutes,
+        verbose=verbose,
+        cycle_detection=cycle_detection,
+        engine=engine,
+        processes=processes,
+        cache_size=cache_size,
+    )
+    return decode_grid(cells)
 
 
 def calculate_value(grid):
+    if isinstance(grid, Bitboard):
+        return grid.trees.bit_count() * grid.lumberyards.bit_count()
+    if isinstance(grid, np.ndarray):
+        return int(np.count_nonzero(grid == TREES)) * int(
+            np.count_nonzero(grid == LUMBERYARD)
+        )
     grid_str = "".join("".join(row) for row in grid)
     return grid_str.count("|") * grid_str.count("#")
@@ -1,117 +1,26 @@
 from collections import Counter, defaultdict
 from pprint import pprint
 
-
-def addr(registers, a, b, c):
-    """(add register) stores into register C the result of adding register A and register B."""
-    registers[c] = registers[a] + registers[b]
-
-
-def addi(registers, a, b, c):
-    """(add immediate) stores into register C the result of adding register A and value B."""
-    registers[c] = registers[a] + b
-
-
-def mulr(registers, a, b, c):
-    """(multiply register) stores into register C the result of multiplying register A and register B."""
-    registers[c] = registers[a] * registers[b]
-
-
-def muli(registers, a, b, c):
-    """(multiply immediate) stores into register C the result of multiplying register A and value B."""
-    registers[c] = registers[a] * b
-
-
-def banr(registers, a, b, c):
-    """(bitwise AND register) stores into register C the result of the bitwise AND of register A and register B."""
-    registers[c] = registers[a] & registers[b]
-
-
-def bani(registers, a, b, c):
-    """(bitwise AND immediate) stores into register C the result of the bitwise AND of register A and value B."""
-    registers[c] = registers[a] & b
-
-
-def borr(registers, a, b, c):
-    """(bitwise OR register) stores into register C the result of the bitwise OR of register A and register B."""
-    registers[c] = registers[a] | registers[b]
-
-
-def bori(registers, a, b, c):
-    """(bitwise OR immediate) stores into register C the result of the bitwise OR of register A and value B."""
-    registers[c] = registers[a] | b
-
-
-def setr(registers, a, b, c):
-    """(set register) copies the contents of register A into register C. (Input B is ignored.)"""
-    registers[c] = registers[a]
-
-
-def seti(registers, a, b, c):
-    """(set immediate) stores value A into register C. (Input B is ignored.)"""
-    registers[c] = a
-
-
-def gtir(registers, a, b, c):
-    """(greater-than immediate/register) sets register C to 1 if value A is greater than register B. Otherwise, register C is set to 0."""
-    registers[c] = int(a > registers[b])
-
-
-def gtri(registers, a, b, c):
-    """(greater-than register/immediate) sets register C to 1 if register A is greater than value B. Otherwise, register C is set to 0."""
-    registers[c] = int(registers[a] > b)
-
-
-def gtrr(registers, a, b, c):
-    """(greater-than register/register) sets register C to 1 if register A is greater than register B. Otherwise, register C is set to 0."""
-    registers[c] = int(registers[a] > registers[b])
-
-
-def eqir(registers, a, b, c):
-    """(equal immediate/register) sets register C to 1 if value A is equal to register B. Otherwise, register C is set to 0."""
-    registers[c] = int(a == registers[b])
-
-
-def eqri(registers, a, b, c):
-    """(equal register/immediate) sets register C to 1 if register A is equal to value B. Otherwise, register C is set to 0."""
-    registers[c] = int(registers[a] == b)
-
-
-def eqrr(registers, a, b, c):
-    """(equal register/register) sets register C to 1 if register A is equal to register B. Otherwise, register C is set to 0."""
-    registers[c] = int(registers[a] == registers[b])
+from elfcode import CACHE_DIR, compile_program, execute, parse_program
+from elfcode_batch import run_batch
 
 
 def parse_puzzle(puzzle_input_file):
-    program = []
-    ip = None
-    with open(puzzle_input_file, "r") as puzzle_input:
-        for line in puzzle_input:
-            line = line.strip()
-            if line.startswith("#ip"):
-                ip = int(line.split()[1])
-            else:
-                op, a, b, c = line.split()
-                program.append((eval(op), int(a), int(b), int(c)))
-    return ip, program
+    return parse_program(puzzle_input_file)
 
 
-def run_puzzle_program(puzzle_input_file, registers, verbose=False):
+def run_puzzle_program(puzzle_input_file, registers, verbose=False, report=False):
     ip, program = parse_puzzle(puzzle_input_file)
-    num_instr = len(program)
-
-    while registers[ip] < num_instr:
-        instr, a, b, c = program[registers[ip]]
-        # Shortcut to actually finish calculation instead of running millions of instructions
-        if registers[ip] == 1:
-            registers[0] = sum(
-                [x for x in range(1, registers[3] + 1) if registers[3] % x == 0]
-            )
-            break
-        if verbose:
-            print(f"ip={ip} {registers} {instr.__name__} {a} {b} {c}", end=" ")
-        instr(registers, a, b, c)
-        if verbose:
-            print(registers)
-        registers[ip] += 1
+    compiled = compile_program(
+        program, ip, blocks=not verbose, cache_dir=CACHE_DIR, idioms=True
+    )
+    execution = execute(compiled, registers, verbose=verbose)
+    if report:
+        print(execution.report())
     return registers
+
+
+def run_puzzle_programs(puzzle_input_file, registers, max_steps=None):
+    """Run the program on every row of ``registers`` at once (see ``run_batch``)."""
+    ip, program = parse_puzzle(puzzle_input_file)
+    return run_batch(program, ip, registers, max_steps=max_steps)
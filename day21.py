@@ -1,123 +1,156 @@
-from collections import Counter, defaultdict
+import os
+from collections import Counter, defaultdict, namedtuple
 from pprint import pprint
 
+import numpy as np
 
-def addr(registers, a, b, c):
-    """(add register) stores into register C the result of adding register A and register B."""
-    registers[c] = registers[a] + registers[b]
+from elfcode import (
+    CACHE_DIR,
+    Checkpoint,
+    Execution,
+    Watch,
+    checkpoint_key,
+    compile_program,
+    execute,
+    find_watch_cycle,
+    load_checkpoint,
+    parse_program,
+    save_checkpoint,
+)
+from elfcode_batch import HALTED, run_batch
 
-
-def addi(registers, a, b, c):
-    """(add immediate) stores into register C the result of adding register A and value B."""
-    registers[c] = registers[a] + b
-
-
-def mulr(registers, a, b, c):
-    """(multiply register) stores into register C the result of multiplying register A and register B."""
-    registers[c] = registers[a] * registers[b]
-
-
-def muli(registers, a, b, c):
-    """(multiply immediate) stores into register C the result of multiplying register A and value B."""
-    registers[c] = registers[a] * b
-
-
-def banr(registers, a, b, c):
-    """(bitwise AND register) stores into register C the result of the bitwise AND of register A and register B."""
-    registers[c] = registers[a] & registers[b]
-
-
-def bani(registers, a, b, c):
-    """(bitwise AND immediate) stores into register C the result of the bitwise AND of register A and value B."""
-    registers[c] = registers[a] & b
-
-
-def borr(registers, a, b, c):
-    """(bitwise OR register) stores into register C the result of the bitwise OR of register A and register B."""
-    registers[c] = registers[a] | registers[b]
-
-
-def bori(registers, a, b, c):
-    """(bitwise OR immediate) stores into register C the result of the bitwise OR of register A and value B."""
-    registers[c] = registers[a] | b
-
-
-def setr(registers, a, b, c):
-    """(set register) copies the contents of register A into register C. (Input B is ignored.)"""
-    registers[c] = registers[a]
-
-
-def seti(registers, a, b, c):
-    """(set immediate) stores value A into register C. (Input B is ignored.)"""
-    registers[c] = a
-
-
-def gtir(registers, a, b, c):
-    """(greater-than immediate/register) sets register C to 1 if value A is greater than register B. Otherwise, register C is set to 0."""
-    registers[c] = int(a > registers[b])
-
-
-def gtri(registers, a, b, c):
-    """(greater-than register/immediate) sets register C to 1 if register A is greater than value B. Otherwise, register C is set to 0."""
-    registers[c] = int(registers[a] > b)
-
-
-def gtrr(registers, a, b, c):
-    """(greater-than register/register) sets register C to 1 if register A is greater than register B. Otherwise, register C is set to 0."""
-    registers[c] = int(registers[a] > registers[b])
-
-
-def eqir(registers, a, b, c):
-    """(equal immediate/register) sets register C to 1 if value A is equal to register B. Otherwise, register C is set to 0."""
-    registers[c] = int(a == registers[b])
-
-
-def eqri(registers, a, b, c):
-    """(equal register/immediate) sets register C to 1 if register A is equal to value B. Otherwise, register C is set to 0."""
-    registers[c] = int(registers[a] == b)
-
-
-def eqrr(registers, a, b, c):
-    """(equal register/register) sets register C to 1 if register A is equal to register B. Otherwise, register C is set to 0."""
-    registers[c] = int(registers[a] == registers[b])
+CHECKPOINT_EVERY = 100_000_000
+HaltingValues = namedtuple("HaltingValues", ["first", "last", "lowest", "highest"])
 
 
 def parse_puzzle(puzzle_input_file):
-    program = []
-    ip = None
-    with open(puzzle_input_file, "r") as puzzle_input:
-        for line in puzzle_input:
-            line = line.strip()
-            if line.startswith("#ip"):
-                ip = int(line.split()[1])
-            else:
-                op, a, b, c = line.split()
-                program.append((eval(op), int(a), int(b), int(c)))
-    return ip, program
-
-
-def run_puzzle_program(puzzle_input_file, registers, verbose=False):
+    return parse_program(puzzle_input_file)
+
+
+def find_halt_check(program, ip):
+    """
+    Find the instruction that compares a register to register 0 and halts if
+    they are equal, returning its pc and the register it checks.
+    """
+    for pc, (op, a, b, c) in enumerate(program):
+        if op == "eqrr" and 0 in (a, b) and a != b:
+            register = b if a == 0 else a
+            if register != ip:
+                return pc, register
+    raise ValueError("Could not find the halting check")
+
+
+def run_puzzle_program(
+    puzzle_input_file,
+    registers,
+    halt_check=None,
+    cycle_detection="set",
+    checkpoint_file=None,
+    checkpoint_every=CHECKPOINT_EVERY,
+    resume=False,
+    verbose=False,
+    report=False,
+):
+    """
+    Find the values of register 0 that make the program halt after the fewest
+    and the most instructions, without running it to completion.
+
+    ``halt_check`` is the ``(pc, register)`` compared against register 0,
+    found automatically if not given. ``cycle_detection`` is either
+    ``"set"``, which remembers every value seen, or ``"brent"``, which uses
+    constant memory at the cost of running the program about three times as
+    far.
+
+    With ``checkpoint_file``, the machine state and the halting values seen so
+    far are saved there every ``checkpoint_every`` instructions, and
+    ``resume`` continues from it if it exists. This needs ``"set"``.
+    """
     ip, program = parse_puzzle(puzzle_input_file)
-    num_instr = len(program)
+    if halt_check is None:
+        halt_check = find_halt_check(program, ip)
+    halt_pc, halt_register = halt_check
+    compiled = compile_program(
+        program,
+        ip,
+        blocks=not verbose,
+        breaks={halt_pc},
+        cache_dir=CACHE_DIR,
+        idioms=True,
+    )
+    if cycle_detection == "brent":
+        if checkpoint_file is not None:
+            raise ValueError("Checkpoints need cycle_detection='set'")
+        cycle = find_watch_cycle(compiled, registers, halt_pc, f"r[{halt_register}]")
+        return HaltingValues(cycle.first, cycle.last, cycle.lowest, cycle.highest)
+    elif cycle_detection != "set":
+        raise ValueError(f"Unknown cycle detection method '{cycle_detection}'")
+
+    # Save values that would cause program to halt
     halt_set = set()
-    last_halter = None
-    while registers[ip] < num_instr:
-        instr, a, b, c = program[registers[ip]]
-        if verbose:
-            print(f"ip={ip} {registers} {instr.__name__} {a} {b} {c}", end=" ")
-        # Save values that would cause program to halt
-        if registers[ip] == 28:
-            if registers[3] not in halt_set:
-                halt_set.add(registers[3])
-                last_halter = registers[3]
-            else:
-                print("Saw repeat, stopping")
-                print(
-                    f"Highest: {max(halt_set)}\t Lowest: {min(halt_set)}\t Last: {last_halter}"
-                )
-                break
-        instr(registers, a, b, c)
-        if verbose:
-            print(registers)
-        registers[ip] += 1
-    return registers
+    first_halter = last_halter = None
+    repeated = False
+
+    def check_halter(value):
+        nonlocal first_halter, last_halter, repeated
+        if value in halt_set:
+            repeated = True
+            return True
+        if first_halter is None:
+            first_halter = value
+        halt_set.add(value)
+        last_halter = value
+        return False
+
+    pc = None
+    instructions = resumed_instructions = 0
+    seconds = 0
+    key = checkpoint_key(program, ip, tuple(halt_check))
+    if resume and checkpoint_file is not None and os.path.exists(checkpoint_file):
+        checkpoint = load_checkpoint(checkpoint_file, key)
+        registers[:] = checkpoint.registers
+        pc = checkpoint.pc
+        instructions = resumed_instructions = checkpoint.instructions
+        if checkpoint.watch_state:
+            first_halter, last_halter, *seen = checkpoint.watch_state
+            halt_set.update(seen)
+
+    watch = Watch(halt_pc, f"r[{halt_register}]", check_halter)
+    while True:
+        execution = execute(
+            compiled,
+            registers,
+            pc=pc,
+            watches=[watch],
+            max_steps=checkpoint_every if checkpoint_file is not None else None,
+            check_first=True,
+            verbose=verbose,
+        )
+        instructions += execution.instructions
+        seconds += execution.seconds
+        pc = execution.pc
+        if repeated or not 0 <= pc < len(program):
+            break
+        watch_state = [first_halter, last_halter, *halt_set] if halt_set else []
+        save_checkpoint(
+            checkpoint_file, Checkpoint(pc, instructions, registers, watch_state), key
+        )
+    if report:
+        executed = instructions - resumed_instructions
+        print(Execution(registers, pc, executed, seconds).report())
+    if not repeated:
+        raise ValueError("Program halted before its halting values repeated")
+    return HaltingValues(first_halter, last_halter, min(halt_set), max(halt_set))
+
+
+def sweep_register_zero(puzzle_input_file, values, max_steps=None):
+    """
+    Run the program once for every starting value of register 0 in ``values``
+    as a single batch, and return how many instructions each value that made
+    the program halt within ``max_steps`` took.
+    """
+    ip, program = parse_puzzle(puzzle_input_file)
+    registers = np.zeros((len(values), 6), dtype=np.int64)
+    registers[:, 0] = values
+    result = run_batch(program, ip, registers, max_steps=max_steps)
+    halted = result.status == HALTED
+    return dict(zip(np.asarray(values)[halted].tolist(), result.steps[halted].tolist()))
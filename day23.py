@@ -1,110 +1,295 @@
-from collections import Counter, defaultdict, deque, namedtuple
+import re
+from collections import defaultdict, deque, namedtuple
 from copy import deepcopy
+from heapq import heappop, heappush
+from itertools import product
+from math import prod
 from operator import itemgetter
 
-Line = namedtuple("Line", ["pos", "r"])
-Space = namedtuple("Space", ["dims", "mins", "maxes"])
+import numpy as np
 
+# One int64 array per column, with a row for every bot in the input
+Bots = namedtuple("Bots", ["x", "y", "z", "r"])
+Space = namedtuple("Space", ["bots", "mins", "maxes"])
 
-def defaultdict_int():
-    return defaultdict(int)
+INT_PATTERN = re.compile(rb"-?\d+")
 
 
-def defaultdict_dict():
-    return defaultdict(dict)
-
-
-def defaultdict_defaultdict_int():
-    return defaultdict(defaultdict_int)
+def parse_puzzle(puzzle_input_file):
+    with open(puzzle_input_file, "rb") as puzzle_input:
+        numbers = INT_PATTERN.findall(puzzle_input.read())
+    columns = np.array(numbers, dtype=np.int64).reshape(-1, 4).T.copy()
+    bots = Bots(*columns)
+    if len(bots.r):
+        mins = [int(column.min()) for column in columns[:3]]
+        maxes = [int(column.max()) for column in columns[:3]]
+    else:
+        mins = [float("inf")] * 3
+        maxes = [float("-inf")] * 3
+    return Space(bots, mins, maxes)
 
 
-def parse_puzzle(puzzle_input_file):
-    dims = defaultdict(defaultdict_dict)
-    mins = [float("inf")] * 3
-    maxes = [float("-inf")] * 3
-    with open(puzzle_input_file, "r") as puzzle_input:
-        for line in puzzle_input:
-            line = line.strip().replace("<", "(").replace(">", ")")
-            line = eval(f"Line({line})")
-            for dim, val in enumerate(line.pos):
-                mins[dim] = min(mins[dim], val)
-                maxes[dim] = max(maxes[dim], val)
-            dims[line.pos[0]][line.pos[1]][line.pos[2]] = line.r
-    return Space(dims, mins, maxes)
+def bot_positions(bots):
+    return np.column_stack((bots.x, bots.y, bots.z))
 
 
 def find_strongest_bot(space):
-    largest_radius = float("-inf")
-    coords = None
-    for x, y_dim in space.dims.items():
-        for y, z_dim in y_dim.items():
-            for z, radius in z_dim.items():
-                if radius > largest_radius:
-                    largest_radius = radius
-                    coords = (x, y, z)
-    return coords, largest_radius
+    if not len(space.bots.r):
+        return None, float("-inf")
+    strongest = int(np.argmax(space.bots.r))
+    coords = tuple(int(column[strongest]) for column in space.bots[:3])
+    return coords, int(space.bots.r[strongest])
 
 
 def count_bots_in_range(space, coords, radius, verbose=False):
     x1, y1, z1 = coords
-    num_in_range = 0
-    valid_x_range = set(range(x1 - radius, x1 + radius + 1))
-    valid_y_range = set(range(y1 - radius, y1 + radius + 1))
-    valid_z_range = set(range(z1 - radius, z1 + radius + 1))
-    for x2, y_dim in space.dims.items():
-        if x2 in valid_x_range:
-            for y2, z_dim in y_dim.items():
-                if y2 in valid_y_range:
-                    for z2 in z_dim.keys():
-                        if z2 in valid_z_range:
-                            dist = abs(x1 - x2) + abs(y1 - y2) + abs(z1 - z2)
-                            in_range = dist <= radius
-                            if verbose:
-                                print(
-                                    f"The nanobot at {x2},{y2},{z2} is distance {dist} away, and so it is {'in range' if in_range else 'NOT in range'}."
-                                )
-                            if in_range:
-                                num_in_range += 1
-    return num_in_range
-
-
-def get_bot_range_coords(space, x1, y1, z1, radius):
-    range_coords = list()
-    for x2 in range(x1 - radius, x1 + radius + 1):
-        x_dist = abs(x1 - x2)
-        for y2 in range(y1 - radius, y1 + radius + 1):
-            y_dist = abs(y1 - y2)
-            if x_dist + y_dist <= radius:
-                for z2 in range(z1 - radius, z1 + radius + 1):
-                    dist = x_dist + y_dist + abs(z1 - z2)
-                    if dist <= radius:
-                        range_coords.append((x2, y2, z2))
-    return range_coords
+    bots = space.bots
+    dists = np.abs(bots.x - x1) + np.abs(bots.y - y1) + np.abs(bots.z - z1)
+    in_range = dists <= radius
+    if verbose:
+        for x2, y2, z2, dist, bot_in_range in zip(
+            bots.x.tolist(),
+            bots.y.tolist(),
+            bots.z.tolist(),
+            dists.tolist(),
+            in_range.tolist(),
+        ):
+            print(
+                f"The nanobot at {x2},{y2},{z2} is distance {dist} away, and so it is {'in range' if bot_in_range else 'NOT in range'}."
+            )
+    return int(np.count_nonzero(in_range))
+
+
+# Manhattan distance is the largest of the absolute projections of a vector
+# onto these diagonals, so a bot's range is the points whose projections are
+# all within its radius of its own.
+DIAGONALS = np.array([(1, 1, 1), (1, 1, -1), (1, -1, 1), (-1, 1, 1)])
+
+
+def distance_to_box(coords, low, size):
+    """
+    Manhattan distance from ``coords``, or from each row of an array of them,
+    to the nearest point of a cube.
+    """
+    low = np.asarray(low)
+    high = low + size - 1
+    return (np.maximum(low - coords, 0) + np.maximum(coords - high, 0)).sum(axis=-1)
+
+
+def bound_box(positions, radii, projections, low, size):
+    """
+    An upper bound on the number of bots in range of any point in a cube, and
+    a lower bound on the distance to the origin of the points in the cube in
+    range of that many. ``projections`` holds each bot's position projected
+    onto the ``DIAGONALS``.
+
+    The bots that reach the cube at all bound the count. A point in range of
+    all of them has each projection within every one of their intervals, so
+    the nearest that the intersection of those intervals gets to zero bounds
+    its distance. If they do not intersect, no point is in range of them all.
+    """
+    reaching = distance_to_box(positions, low, size) <= radii
+    count = int(np.count_nonzero(reaching))
+    corners = DIAGONALS * np.array(low), DIAGONALS * (np.array(low) + size - 1)
+    lows = np.maximum(
+        np.minimum(*corners).sum(axis=1),
+        (projections - radii[:, None])[reaching].max(axis=0, initial=-(1 << 62)),
+    )
+    highs = np.minimum(
+        np.maximum(*corners).sum(axis=1),
+        (projections + radii[:, None])[reaching].min(axis=0, initial=1 << 62),
+    )
+    distance = int(distance_to_box((0, 0, 0), low, size))
+    if (lows > highs).any():
+        return count - 1, distance
+    return count, max(distance, int(lows.max()), int(-highs.min()))
 
 
 def find_best_spot(space, verbose=False):
-    bot_ranges = []
-    common_coords = Counter()
-    for x, y_dim in space.dims.items():
-        for y, z_dim in y_dim.items():
-            for z, radius in z_dim.items():
-                if verbose:
-                    print(f"Calculating range coords for {x, y, z}", flush=True)
-                bot_ranges.append(get_bot_range_coords(space, x, y, z, radius))
-    if verbose:
-        print("Calculating common coords...", end="", flush=True)
-    for range in bot_ranges:
+    """
+    Find the point in range of the most bots, closest to the origin on ties,
+    by branch and bound over cubes. ``bound_box`` bounds the count and the
+    distance of every point in a cube, so cubes come off a heap by most bots,
+    then closest to the origin, and get split into eight until the first
+    single point comes off, which no other cube can beat.
+
+    Returns ``(coords, count)``, or ``(None, 0)`` if there are no bots.
+    """
+    radii = space.bots.r
+    if not len(radii):
+        return None, 0
+    positions = bot_positions(space.bots)
+    projections = positions @ DIAGONALS.T
+    low = (positions - radii[:, None]).min(axis=0)
+    high = (positions + radii[:, None]).max(axis=0)
+    size = 1
+    while (low + size <= high).any():
+        size *= 2
+    low = tuple(low.tolist())
+    count, distance = bound_box(positions, radii, projections, low, size)
+    queue = [(-count, distance, size, low)]
+    while True:
+        neg_count, distance, size, low = heappop(queue)
+        if size == 1:
+            if verbose:
+                print(f"Best spot {low} is in range of {-neg_count} bots")
+            return low, -neg_count
+        half = size // 2
+        for x_delta in (0, half):
+            for y_delta in (0, half):
+                for z_delta in (0, half):
+                    corner = (low[0] + x_delta, low[1] + y_delta, low[2] + z_delta)
+                    count, distance = bound_box(
+                        positions, radii, projections, corner, half
+                    )
+                    if count:
+                        heappush(queue, (-count, distance, half, corner))
         if verbose:
-            print(".", end="", flush=True)
-        for coords in range:
-            common_coords[coords] += 1
-    if verbose:
-        print()
-
-    best_spot, prev_count = common_coords.most_common(1)[0]
-    for coords, count in common_coords.most_common(None):
-        if count != prev_count:
-            break
-        if sum(abs(i) for i in coords) < sum(abs(i) for i in best_spot):
-            best_spot == coords
-    return best_spot
+            print(f"Split cube of size {size} at {low} reaching {-neg_count} bots")
+
+
+class BotIndex:
+    """
+    Grid buckets over a growing set of bots, for repeated range queries.
+
+    Buckets are cubes of ``bucket_size`` in the rotated coordinates ``x + y -
+    z``, ``x - y + z`` and ``-x + y + z``, where a bot's range is a cube cut
+    by a slab on ``x + y + z`` rather than an octahedron. Each bot is filed
+    by its position for ``bots_within``, and under every bucket its range
+    reaches for ``bots_covering``, so a query only checks the bots in the
+    buckets around it. ``bucket_size`` defaults to the largest radius of the
+    first bots, and should be given when starting out empty. Bots whose range
+    spans more than ``max_span`` buckets on an axis are kept aside and
+    checked by every ``bots_covering`` query instead, and ``bots_within``
+    checks every bot once its radius spans more buckets than there are bots.
+
+    Bots are numbered in the order they were inserted, starting from the
+    rows of ``space.bots``.
+    """
+
+    def __init__(self, space=None, bucket_size=None, max_span=4):
+        self.table = np.zeros((0, 4), dtype=np.int64)
+        self.num_bots = 0
+        self.positions = defaultdict(list)
+        self.ranges = defaultdict(list)
+        self.wide = []
+        self.max_span = max_span
+        if bucket_size is None:
+            radii = space.bots.r if space is not None else ()
+            bucket_size = max(int(radii.max()), 1) if len(radii) else 1
+        self.bucket_size = bucket_size
+        if space is not None:
+            self.insert(space.bots)
+
+    @property
+    def bots(self):
+        return Bots(*self.table[: self.num_bots].T)
+
+    def insert(self, bots):
+        """Add ``Bots`` columns, or scalars for one bot, and return their ids."""
+        rows = np.column_stack([np.atleast_1d(column) for column in bots])
+        first_id = self.num_bots
+        if first_id + len(rows) > len(self.table):
+            capacity = max(first_id + len(rows), 2 * len(self.table))
+            table = np.zeros((capacity, 4), dtype=np.int64)
+            table[:first_id] = self.table[:first_id]
+            self.table = table
+        self.table[first_id : first_id + len(rows)] = rows
+        self.num_bots += len(rows)
+
+        rotated = rows[:, :3] @ DIAGONALS[1:].T
+        sums = rows[:, :3] @ DIAGONALS[0]
+        radii = rows[:, 3]
+        size = self.bucket_size
+        keys = rotated // size
+        lows = ((rotated - radii[:, None]) // size).tolist()
+        highs = ((rotated + radii[:, None]) // size).tolist()
+        for bot_id, key, low, high, total, radius in zip(
+            range(first_id, self.num_bots),
+            map(tuple, keys.tolist()),
+            lows,
+            highs,
+            sums.tolist(),
+            radii.tolist(),
+        ):
+            self.positions[key].append(bot_id)
+            if any(stop - start >= self.max_span for start, stop in zip(low, high)):
+                self.wide.append(bot_id)
+                continue
+            for bucket in product(
+                *(range(start, stop + 1) for start, stop in zip(low, high))
+            ):
+                # The rotated coordinates of the bucket's corners add up to
+                # somewhere in this range, which has to meet the range's slab
+                if (
+                    sum(bucket) * size <= total + radius
+                    and (sum(bucket) + 3) * size - 3 >= total - radius
+                ):
+                    self.ranges[bucket].append(bot_id)
+        return np.arange(first_id, self.num_bots)
+
+    def distances(self, bot_ids, coords):
+        """Manhattan distances from the bots in ``bot_ids`` to ``coords``."""
+        return np.abs(self.table[bot_ids, :3] - coords).sum(axis=1)
+
+    def bots_covering_batch(self, points):
+        """
+        For each row of a ``(N, 3)`` array of points, the ids of the bots in
+        range of it. Points in the same bucket are checked together.
+        """
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 3)
+        keys = (points @ DIAGONALS[1:].T) // self.bucket_size
+        buckets, bucket_indices = np.unique(keys, axis=0, return_inverse=True)
+        results = [None] * len(points)
+        for bucket_index, bucket in enumerate(map(tuple, buckets.tolist())):
+            point_indices = np.flatnonzero(bucket_indices.ravel() == bucket_index)
+            candidates = np.array(
+                self.ranges.get(bucket, []) + self.wide, dtype=np.int64
+            )
+            dists = np.abs(
+                points[point_indices, None, :] - self.table[None, candidates, :3]
+            ).sum(axis=2)
+            in_range = dists <= self.table[candidates, 3]
+            for point_index, covered in zip(point_indices.tolist(), in_range):
+                results[point_index] = candidates[covered]
+        return results
+
+    def bots_covering(self, coords):
+        return self.bots_covering_batch([coords])[0]
+
+    def bots_within_batch(self, points, radii):
+        """
+        For each row of a ``(N, 3)`` array of points, the ids of the bots
+        positioned within the matching radius of it.
+        """
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 3)
+        radii = np.broadcast_to(np.asarray(radii, dtype=np.int64), len(points))
+        rotated = points @ DIAGONALS[1:].T
+        lows = ((rotated - radii[:, None]) // self.bucket_size).tolist()
+        highs = ((rotated + radii[:, None]) // self.bucket_size).tolist()
+        results = []
+        for coords, radius, low, high in zip(points, radii.tolist(), lows, highs):
+            num_buckets = prod(stop - start + 1 for start, stop in zip(low, high))
+            if num_buckets > self.num_bots:
+                candidates = np.arange(self.num_bots)
+            else:
+                candidates = np.array(
+                    [
+                        bot_id
+                        for bucket in product(
+                            *(range(start, stop + 1) for start, stop in zip(low, high))
+                        )
+                        for bot_id in self.positions.get(bucket, ())
+                    ],
+                    dtype=np.int64,
+                )
+            results.append(candidates[self.distances(candidates, coords) <= radius])
+        return results
+
+    def bots_within(self, coords, radius):
+        return self.bots_within_batch([coords], [radius])[0]
+
+    def bots_in_range_of(self, bot_id):
+        """The ids of the bots positioned within range of bot ``bot_id``."""
+        x, y, z, radius = self.table[bot_id].tolist()
+        return self.bots_within((x, y, z), radius)
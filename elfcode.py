@@ -0,0 +1,943 @@
+"""Shared ElfCode machinery used by days 16, 19 and 21."""
+
+import hashlib
+import importlib.util
+import json
+import marshal
+import math
+import os
+import random
+import struct
+import time
+from array import array
+from collections import Counter, namedtuple
+
+
+def addr(registers, a, b, c):
+    """(add register) stores into register C the result of adding register A and register B."""
+    registers[c] = registers[a] + registers[b]
+    return registers
+
+
+def addi(registers, a, b, c):
+    """(add immediate) stores into register C the result of adding register A and value B."""
+    registers[c] = registers[a] + b
+    return registers
+
+
+def mulr(registers, a, b, c):
+    """(multiply register) stores into register C the result of multiplying register A and register B."""
+    registers[c] = registers[a] * registers[b]
+    return registers
+
+
+def muli(registers, a, b, c):
+    """(multiply immediate) stores into register C the result of multiplying register A and value B."""
+    registers[c] = registers[a] * b
+    return registers
+
+
+def banr(registers, a, b, c):
+    """(bitwise AND register) stores into register C the result of the bitwise AND of register A and register B."""
+    registers[c] = registers[a] & registers[b]
+    return registers
+
+
+def bani(registers, a, b, c):
+    """(bitwise AND immediate) stores into register C the result of the bitwise AND of register A and value B."""
+    registers[c] = registers[a] & b
+    return registers
+
+
+def borr(registers, a, b, c):
+    """(bitwise OR register) stores into register C the result of the bitwise OR of register A and register B."""
+    registers[c] = registers[a] | registers[b]
+    return registers
+
+
+def bori(registers, a, b, c):
+    """(bitwise OR immediate) stores into register C the result of the bitwise OR of register A and value B."""
+    registers[c] = registers[a] | b
+    return registers
+
+
+def setr(registers, a, b, c):
+    """(set register) copies the contents of register A into register C. (Input B is ignored.)"""
+    registers[c] = registers[a]
+    return registers
+
+
+def seti(registers, a, b, c):
+    """(set immediate) stores value A into register C. (Input B is ignored.)"""
+    registers[c] = a
+    return registers
+
+
+def gtir(registers, a, b, c):
+    """(greater-than immediate/register) sets register C to 1 if value A is greater than register B. Otherwise, register C is set to 0."""
+    registers[c] = int(a > registers[b])
+    return registers
+
+
+def gtri(registers, a, b, c):
+    """(greater-than register/immediate) sets register C to 1 if register A is greater than value B. Otherwise, register C is set to 0."""
+    registers[c] = int(registers[a] > b)
+    return registers
+
+
+def gtrr(registers, a, b, c):
+    """(greater-than register/register) sets register C to 1 if register A is greater than register B. Otherwise, register C is set to 0."""
+    registers[c] = int(registers[a] > registers[b])
+    return registers
+
+
+def eqir(registers, a, b, c):
+    """(equal immediate/register) sets register C to 1 if value A is equal to register B. Otherwise, register C is set to 0."""
+    registers[c] = int(a == registers[b])
+    return registers
+
+
+def eqri(registers, a, b, c):
+    """(equal register/immediate) sets register C to 1 if register A is equal to value B. Otherwise, register C is set to 0."""
+    registers[c] = int(registers[a] == b)
+    return registers
+
+
+def eqrr(registers, a, b, c):
+    """(equal register/register) sets register C to 1 if register A is equal to register B. Otherwise, register C is set to 0."""
+    registers[c] = int(registers[a] == registers[b])
+    return registers
+
+
+OPCODES = {
+    func.__name__: func
+    for func in (
+        addr,
+        addi,
+        mulr,
+        muli,
+        banr,
+        bani,
+        borr,
+        bori,
+        setr,
+        seti,
+        gtir,
+        gtri,
+        gtrr,
+        eqir,
+        eqri,
+        eqrr,
+    )
+}
+INSTRUCTIONS = set(OPCODES.values())
+
+# Python expression for the value each opcode stores in register C. ``ra`` and
+# ``rb`` are rendered register reads, ``a`` and ``b`` are the raw immediates.
+OPCODE_SOURCE = {
+    "addr": "{ra} + {rb}",
+    "addi": "{ra} + {b}",
+    "mulr": "{ra} * {rb}",
+    "muli": "{ra} * {b}",
+    "banr": "{ra} & {rb}",
+    "bani": "{ra} & {b}",
+    "borr": "{ra} | {rb}",
+    "bori": "{ra} | {b}",
+    "setr": "{ra}",
+    "seti": "{a}",
+    "gtir": "1 if {a} > {rb} else 0",
+    "gtri": "1 if {ra} > {b} else 0",
+    "gtrr": "1 if {ra} > {rb} else 0",
+    "eqir": "1 if {a} == {rb} else 0",
+    "eqri": "1 if {ra} == {b} else 0",
+    "eqrr": "1 if {ra} == {rb} else 0",
+}
+
+CompiledProgram = namedtuple(
+    "CompiledProgram", ["ip", "program", "steps", "lengths", "boundaries", "idioms"]
+)
+Watch = namedtuple("Watch", ["pc", "expr", "callback"])
+Checkpoint = namedtuple(
+    "Checkpoint", ["pc", "instructions", "registers", "watch_state"]
+)
+# Magic, format version, run key, pc, instruction count, register count
+CHECKPOINT_HEADER = struct.Struct("<4sH32sqQH")
+CHECKPOINT_MAGIC = b"ELFV"
+CHECKPOINT_VERSION = 2
+WatchCycle = namedtuple(
+    "WatchCycle", ["first", "last", "lowest", "highest", "start", "length"]
+)
+CACHE_DIR = os.environ.get(
+    "ELFCODE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "aoc-2018")
+)
+# Bump whenever the generated source changes so stale cache entries are ignored
+COMPILER_VERSION = 2
+
+
+class Execution(
+    namedtuple("Execution", ["registers", "pc", "instructions", "seconds"])
+):
+    __slots__ = ()
+
+    @property
+    def rate(self):
+        """Instructions executed per second."""
+        return self.instructions / self.seconds if self.seconds else float("inf")
+
+    def report(self):
+        return (
+            f"Executed {self.instructions:,} instructions in {self.seconds:.2f}s "
+            f"({self.rate:,.0f}/s)"
+        )
+
+
+def parse_program(puzzle_input_file):
+    program = []
+    ip = None
+    with open(puzzle_input_file, "r") as puzzle_input:
+        for line in puzzle_input:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#ip"):
+                ip = int(line.split()[1])
+            else:
+                op, a, b, c = line.split()
+                if op not in OPCODES:
+                    raise ValueError(f"Unknown instruction '{op}'")
+                program.append((op, int(a), int(b), int(c)))
+    return ip, program
+
+
+def instruction_source(instruction, pc, ip, read=None):
+    """
+    Render the expression an instruction at ``pc`` stores into register C.
+
+    Reads of the ``#ip`` register are replaced by the constant ``pc``, since
+    that is always its value while the instruction runs. Other register reads
+    are rendered by ``read``, which defaults to indexing the register list.
+    """
+    op, a, b, c = instruction
+    if read is None:
+        read = "r[{}]".format
+
+    def read_register(register):
+        return str(pc) if register == ip else read(register)
+
+    template = OPCODE_SOURCE[op]
+    return template.format(
+        a=a,
+        b=b,
+        ra=read_register(a) if "{ra}" in template else None,
+        rb=read_register(b) if "{rb}" in template else None,
+    )
+
+
+def block_ranges(program, ip=None, breaks=()):
+    """
+    Yield ``(start, end)`` for the basic block that begins at every ``pc``.
+
+    Blocks end after any instruction that writes the ``#ip`` register and
+    before any pc in ``breaks``, so execution can always be stopped there.
+    Every pc gets its own block because computed jumps can land anywhere.
+    """
+    num_instr = len(program)
+    breaks = set(breaks)
+    for start in range(num_instr):
+        end = start + 1
+        while end < num_instr and program[end - 1][3] != ip and end not in breaks:
+            end += 1
+        yield start, end
+
+
+def block_source(program, start, end, ip=None):
+    """
+    Render the body of the step function for ``program[start:end]``.
+
+    Registers are loaded into locals on first read and only the ones the
+    block wrote are stored back, right before it returns the next pc.
+    """
+    loads = []
+    body = []
+    seen = set()
+    written = []
+
+    def read(register):
+        if register not in seen:
+            seen.add(register)
+            loads.append(f"    x{register} = r[{register}]")
+        return f"x{register}"
+
+    next_pc = str(end)
+    for pc in range(start, end):
+        instruction = program[pc]
+        expr = instruction_source(instruction, pc, ip, read)
+        c = instruction[3]
+        if c == ip:
+            next_pc = f"({expr}) + 1"
+            break
+        body.append(f"    x{c} = {expr}")
+        seen.add(c)
+        if c not in written:
+            written.append(c)
+    stores = [f"    r[{c}] = x{c}" for c in written]
+    return loads + body + stores + [f"    return {next_pc}"]
+
+
+def generate_source(program, ip=None, blocks=False, breaks=()):
+    """
+    Generate Python source defining a ``_step_<pc>`` function for every pc.
+
+    Each step function takes the register list and returns the next program
+    counter, so the ``#ip`` register only has to be written back when the
+    machine stops. With ``blocks`` each function runs a whole basic block.
+    """
+    lines = []
+    if blocks:
+        for start, end in block_ranges(program, ip, breaks):
+            lines.append(f"def _step_{start}(r):")
+            lines.extend(block_source(program, start, end, ip))
+        return "\n".join(lines)
+    for pc, instruction in enumerate(program):
+        expr = instruction_source(instruction, pc, ip)
+        lines.append(f"def _step_{pc}(r):")
+        if instruction[3] == ip:
+            lines.append(f"    return ({expr}) + 1")
+        else:
+            lines.append(f"    r[{instruction[3]}] = {expr}")
+            lines.append(f"    return {pc + 1}")
+    return "\n".join(lines)
+
+
+def program_text(program, ip=None):
+    lines = [] if ip is None else [f"#ip {ip}"]
+    lines.extend(" ".join(str(part) for part in instruction) for instruction in program)
+    return "\n".join(lines)
+
+
+def read_cached_code(path):
+    try:
+        with open(path, "rb") as cache_file:
+            return marshal.load(cache_file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def write_cached_code(path, code):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as cache_file:
+        marshal.dump(code, cache_file)
+    os.replace(tmp_path, path)
+
+
+def compile_program(
+    program, ip=None, blocks=False, breaks=(), cache_dir=None, idioms=False
+):
+    """
+    Compile ``program`` into one specialized Python function per instruction,
+    or per basic block if ``blocks`` is set (see ``block_ranges``).
+
+    With ``idioms``, hot loops recognized by ``find_idioms`` are replaced by
+    their closed forms, each counted as a single executed instruction.
+
+    If ``cache_dir`` is given, the compiled code object is stored there keyed
+    by a hash of the program text and the compile options, so later runs of
+    the same program skip code generation and compilation entirely.
+    """
+    program = tuple(tuple(instruction) for instruction in program)
+    matches = find_idioms(program, ip, cache_dir=cache_dir) if idioms else ()
+    if blocks:
+        breaks = frozenset(breaks).union(match.start for match in matches)
+        lengths = tuple(end - start for start, end in block_ranges(program, ip, breaks))
+    else:
+        breaks = frozenset(range(len(program)))
+        lengths = (1,) * len(program)
+    code = None
+    if cache_dir is not None:
+        key = hashlib.sha256(
+            "\n".join(
+                (
+                    importlib.util.MAGIC_NUMBER.hex(),
+                    str(COMPILER_VERSION),
+                    str(blocks),
+                    " ".join(str(pc) for pc in sorted(breaks)),
+                    program_text(program, ip),
+                )
+            ).encode()
+        ).hexdigest()
+        cache_path = os.path.join(cache_dir, f"{key}.elfc")
+        code = read_cached_code(cache_path)
+    if code is None:
+        code = compile(
+            generate_source(program, ip, blocks, breaks), "<elfcode>", "exec"
+        )
+        if cache_dir is not None:
+            write_cached_code(cache_path, code)
+    namespace = {}
+    exec(code, namespace)
+    steps = [namespace[f"_step_{pc}"] for pc in range(len(program))]
+    for match in matches:
+        steps[match.start] = IDIOMS[match.name].make_step(match, steps[match.start])
+    return CompiledProgram(ip, program, tuple(steps), lengths, breaks, tuple(matches))
+
+
+def register_expression(expr):
+    """
+    Turn a watch expression into a function of the register list. ``expr``
+    may be a callable, Python source using ``r`` for the registers (e.g.
+    ``"r[3]"``), or None to watch the whole register list.
+    """
+    if expr is None:
+        return list
+    if callable(expr):
+        return expr
+    return eval(f"lambda r: {expr}")
+
+
+def execute(
+    compiled,
+    registers,
+    pc=None,
+    stop_at=(),
+    watches=(),
+    max_steps=None,
+    check_first=False,
+    verbose=False,
+):
+    """
+    Run ``compiled`` against ``registers`` (modified in place) until it halts,
+    reaches one of the instruction pointers in ``stop_at``, a ``Watch``
+    callback asks it to stop, or it has executed at least ``max_steps``
+    instructions.
+
+    Watches fire before the instruction at their pc runs, with the #ip
+    register up to date. Execution starts at ``pc``, or the value of the #ip
+    register if not given. Unless ``check_first`` is set, the instruction at
+    the starting pc runs without checking ``stop_at`` or watches, so calling
+    this in a loop resumes cleanly after a stop. Set it when continuing after
+    ``max_steps`` ran out instead.
+    """
+    ip = compiled.ip
+    if pc is None:
+        pc = registers[ip] if ip is not None else 0
+    watch_pcs = set(stop_at).union(watch.pc for watch in watches)
+    if not compiled.boundaries.issuperset(watch_pcs):
+        raise ValueError(
+            f"Cannot stop at {sorted(watch_pcs - compiled.boundaries)}; "
+            "compile the program with them as breaks"
+        )
+    steps = list(compiled.steps)
+    lengths = compiled.lengths
+    num_instr = len(steps)
+    stopped = []
+
+    def make_watch(watch_pc, always_stop, checks, original):
+        def fire(r):
+            if ip is not None:
+                r[ip] = watch_pc
+            stop = always_stop
+            for get, callback in checks:
+                if callback(get(r)):
+                    stop = True
+            if stop:
+                stopped.append(watch_pc)
+                return -1
+            return original(r)
+
+        return fire
+
+    for watch_pc in watch_pcs:
+        if 0 <= watch_pc < num_instr:
+            checks = [
+                (register_expression(watch.expr), watch.callback)
+                for watch in watches
+                if watch.pc == watch_pc
+            ]
+            steps[watch_pc] = make_watch(
+                watch_pc, watch_pc in stop_at, checks, steps[watch_pc]
+            )
+
+    count = 0
+    start = time.perf_counter()
+    if pc in watch_pcs and 0 <= pc < num_instr and not check_first:
+        count += lengths[pc]
+        pc = compiled.steps[pc](registers)
+    if max_steps is None:
+        max_steps = float("inf")
+    if verbose:
+        while 0 <= pc < num_instr and count < max_steps:
+            if ip is not None:
+                registers[ip] = pc
+            op, a, b, c = compiled.program[pc]
+            print(f"ip={pc} {registers} {op} {a} {b} {c}", end=" ")
+            count += lengths[pc]
+            pc = steps[pc](registers)
+            print("(stopped)" if stopped else registers)
+    elif max_steps < float("inf"):
+        while 0 <= pc < num_instr and count < max_steps:
+            count += lengths[pc]
+            pc = steps[pc](registers)
+    else:
+        while 0 <= pc < num_instr:
+            count += lengths[pc]
+            pc = steps[pc](registers)
+    if stopped:
+        pc = stopped.pop()
+        count -= lengths[pc]
+    if ip is not None:
+        registers[ip] = pc
+    return Execution(registers, pc, count, time.perf_counter() - start)
+
+
+def checkpoint_key(program, ip, *details):
+    """
+    Identify a run for its checkpoints by the program text and whatever else
+    decides what the saved state means, such as the registers being watched.
+    """
+    text = "\n".join([program_text(program, ip), *(repr(detail) for detail in details)])
+    return hashlib.sha256(text.encode()).digest()
+
+
+def save_checkpoint(checkpoint_file, checkpoint, key):
+    """
+    Write a ``Checkpoint`` as a compact little-endian binary file, replacing
+    any previous one atomically. Registers and watch state must fit in int64.
+    ``key`` is the run's ``checkpoint_key``, checked by ``load_checkpoint``.
+    """
+    registers = array("q", checkpoint.registers)
+    watch_state = array("q", checkpoint.watch_state)
+    tmp_path = f"{checkpoint_file}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as checkpoint_output:
+        checkpoint_output.write(
+            CHECKPOINT_HEADER.pack(
+                CHECKPOINT_MAGIC,
+                CHECKPOINT_VERSION,
+                key,
+                checkpoint.pc,
+                checkpoint.instructions,
+                len(registers),
+            )
+        )
+        checkpoint_output.write(registers.tobytes())
+        checkpoint_output.write(struct.pack("<Q", len(watch_state)))
+        checkpoint_output.write(watch_state.tobytes())
+    os.replace(tmp_path, checkpoint_file)
+
+
+def load_checkpoint(checkpoint_file, key):
+    with open(checkpoint_file, "rb") as checkpoint_input:
+        data = checkpoint_input.read()
+    magic, version, saved_key, pc, instructions, num_registers = (
+        CHECKPOINT_HEADER.unpack_from(data)
+    )
+    if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+        raise ValueError(
+            f"{checkpoint_file} is not a version {CHECKPOINT_VERSION} checkpoint"
+        )
+    if saved_key != key:
+        raise ValueError(f"{checkpoint_file} was saved by a different run")
+    offset = CHECKPOINT_HEADER.size
+    registers = array("q")
+    registers.frombytes(data[offset : offset + 8 * num_registers])
+    offset += 8 * num_registers
+    (num_watch_state,) = struct.unpack_from("<Q", data, offset)
+    offset += 8
+    watch_state = array("q")
+    watch_state.frombytes(data[offset : offset + 8 * num_watch_state])
+    if len(watch_state) != num_watch_state:
+        raise ValueError(f"{checkpoint_file} is truncated")
+    return Checkpoint(pc, instructions, registers.tolist(), watch_state.tolist())
+
+
+def find_watch_cycle(compiled, registers, watch_pc, expr):
+    """
+    Find where the sequence of values ``expr`` takes each time execution
+    reaches ``watch_pc`` starts repeating, using Brent's algorithm so only two
+    register files are ever kept in memory.
+
+    This assumes each watched value determines the next one, as with the
+    halting checks in day 21, and runs the program roughly three times as far
+    as it takes to see the first repeat.
+    """
+    get = register_expression(expr)
+    lowest = highest = None
+
+    def values():
+        nonlocal lowest, highest
+        vm_registers = registers[:]
+        pc = None
+        while True:
+            execution = execute(compiled, vm_registers, pc=pc, stop_at={watch_pc})
+            if execution.pc != watch_pc:
+                raise ValueError(
+                    f"Program halted before its values at {watch_pc} repeated"
+                )
+            pc = watch_pc
+            value = get(vm_registers)
+            if lowest is None or value < lowest:
+                lowest = value
+            if highest is None or value > highest:
+                highest = value
+            yield value
+
+    hare_values = values()
+    first = tortoise = next(hare_values)
+    hare = next(hare_values)
+    power = length = 1
+    while tortoise != hare:
+        if power == length:
+            tortoise = hare
+            power *= 2
+            length = 0
+        hare = next(hare_values)
+        length += 1
+
+    tortoise_values = values()
+    hare_values = values()
+    tortoise = next(tortoise_values)
+    hare = None
+    for _ in range(length + 1):
+        last, hare = hare, next(hare_values)
+    start = 0
+    while tortoise != hare:
+        tortoise = next(tortoise_values)
+        last, hare = hare, next(hare_values)
+        start += 1
+    return WatchCycle(first, last, lowest, highest, start, length)
+
+
+def static_leaders(program, ip):
+    """
+    The pcs that start a basic block, as far as can be told without running
+    the program: the first instruction, the one after every instruction that
+    writes the ``#ip`` register, and where those jump to when the target is
+    a constant, or one or two past the jump when it adds the result of the
+    comparison just before it.
+    """
+    num_instr = len(program)
+    leaders = {0}
+    for pc, (op, a, b, c) in enumerate(program):
+        if c != ip:
+            continue
+        leaders.add(pc + 1)
+        template = OPCODE_SOURCE[op]
+        reads = [
+            register
+            for register, placeholder in ((a, "{ra}"), (b, "{rb}"))
+            if placeholder in template
+        ]
+        if all(register == ip for register in reads):
+            registers = [0] * (max(ip, a, b, c) + 1)
+            registers[ip] = pc
+            leaders.add(OPCODES[op](registers, a, b, c)[c] + 1)
+        elif op == "addr" and pc and ip in (a, b):
+            # Skipping ahead by a comparison's 0 or 1
+            offset = b if a == ip else a
+            previous_op, *_, previous_c = program[pc - 1]
+            if previous_op[:2] in ("gt", "eq") and previous_c == offset:
+                leaders.add(pc + 2)
+    return sorted(leader for leader in leaders if 0 <= leader < num_instr)
+
+
+def profile(compiled, registers, pc=None, sample_every=None, max_steps=None):
+    """
+    Run ``compiled`` like ``execute`` and return a JSON-serializable profile.
+
+    By default every step is counted, which gives exact per-pc hit counts,
+    per basic block instruction counts and the hot loops, found from the
+    taken back-edges. With ``sample_every``, the program instead runs at full
+    speed and only records which block it is in every ``sample_every``
+    instructions or so. Each sample stands for the instructions run since the
+    last one, spread evenly over that block, so the per-pc and per-block
+    counts are estimates and no loops are found. Blocks come from
+    ``static_leaders`` in both modes.
+    """
+    ip = compiled.ip
+    if pc is None:
+        pc = registers[ip] if ip is not None else 0
+    steps = compiled.steps
+    lengths = compiled.lengths
+    num_instr = len(steps)
+    if max_steps is None:
+        max_steps = float("inf")
+    hits = [0] * num_instr
+    edges = Counter()
+    count = 0
+    start = time.perf_counter()
+    if sample_every is None:
+        entries = [0] * num_instr
+        while 0 <= pc < num_instr and count < max_steps:
+            entries[pc] += 1
+            count += lengths[pc]
+            source = pc + lengths[pc] - 1
+            pc = steps[pc](registers)
+            if pc != source + 1:
+                edges[source, pc] += 1
+        # Attribute each step to every instruction in its block
+        for block_start, block_entries in enumerate(entries):
+            for block_pc in range(block_start, block_start + lengths[block_start]):
+                hits[block_pc] += block_entries
+    else:
+        # Jitter the interval so samples don't alias with loops of the same period
+        jitter = random.Random(0)
+        while 0 <= pc < num_instr and count < max_steps:
+            sampled = count
+            next_sample = min(
+                count + jitter.randint(1, 2 * sample_every - 1), max_steps
+            )
+            while 0 <= pc < num_instr and count < next_sample:
+                block_start = pc
+                count += lengths[pc]
+                pc = steps[pc](registers)
+            # The sample falls in the block that just ran
+            share = (count - sampled) / lengths[block_start]
+            for block_pc in range(block_start, block_start + lengths[block_start]):
+                hits[block_pc] += share
+        hits = [round(pc_hits) for pc_hits in hits]
+    if ip is not None:
+        registers[ip] = pc
+    seconds = time.perf_counter() - start
+
+    leaders = static_leaders(compiled.program, ip)
+    blocks = [
+        {
+            "start": block_start,
+            "end": block_end,
+            "entries": hits[block_start],
+            "instructions": sum(hits[block_start:block_end]),
+        }
+        for block_start, block_end in zip(leaders, leaders[1:] + [num_instr])
+    ]
+    loops = [
+        {
+            "head": target,
+            "tail": source,
+            "iterations": taken,
+            "instructions": sum(hits[target : source + 1]),
+        }
+        for (source, target), taken in edges.items()
+        if 0 <= target <= source
+    ]
+    loops.sort(key=lambda loop: loop["instructions"], reverse=True)
+    return {
+        "mode": "exact" if sample_every is None else "sampled",
+        "sample_every": sample_every,
+        "instructions": count,
+        "seconds": seconds,
+        "final_pc": pc,
+        "hits": hits,
+        "blocks": sorted(blocks, key=lambda block: block["instructions"], reverse=True),
+        "loops": loops,
+    }
+
+
+def profile_puzzle_program(
+    puzzle_input_file, registers, sample_every=None, max_steps=None, report_file=None
+):
+    """
+    Profile the program without any idiom replacements (see ``profile``),
+    optionally writing the report to ``report_file`` as JSON.
+    """
+    ip, program = parse_program(puzzle_input_file)
+    compiled = compile_program(program, ip, blocks=True, cache_dir=CACHE_DIR)
+    report = profile(
+        compiled, registers, sample_every=sample_every, max_steps=max_steps
+    )
+    if report_file is not None:
+        with open(report_file, "w") as report_output:
+            json.dump(report, report_output, indent=2)
+    return report
+
+
+# Operand-order independent opcodes, for matching idiom patterns
+COMMUTATIVE = {"addr", "mulr", "banr", "borr", "eqrr"}
+
+Idiom = namedtuple("Idiom", ["pattern", "exit", "make_step", "samples"])
+IdiomMatch = namedtuple("IdiomMatch", ["name", "start", "exit", "bindings"])
+
+
+def sum_of_divisors(n):
+    total = 0
+    for x in range(1, math.isqrt(n) + 1):
+        if n % x == 0:
+            total += x
+            if x != n // x:
+                total += n // x
+    return total
+
+
+def divisor_sum_step(match, fallback):
+    """
+    Replace nested loops that add every ``i`` where ``i * j == n`` for some
+    ``j`` in ``1..n`` to an accumulator, which takes O(n^2) instructions.
+    """
+    i, j, t, n, acc = (match.bindings[role] for role in ("i", "j", "t", "n", "acc"))
+    exit_pc = match.exit
+
+    def step(r):
+        target = r[n]
+        if target >= 1:
+            r[acc] += sum_of_divisors(target)
+        r[i] = r[j] = max(target, 1) + 1
+        r[t] = 1
+        return exit_pc
+
+    return step
+
+
+def division_step(match, fallback):
+    """
+    Replace a loop that counts ``k`` up from 0 until ``(k + 1) * d > y``,
+    which is just floor division by ``d``.
+    """
+    k, t, y = (match.bindings[role] for role in ("k", "t", "y"))
+    d = match.bindings["#d"]
+    exit_pc = match.exit
+    if d <= 0:
+        return fallback
+
+    def step(r):
+        r[k] = max(0, r[y] // d)
+        r[t] = 1
+        return exit_pc
+
+    return step
+
+
+# Patterns are ``(op, a, b, c)`` where an operand is either a literal
+# immediate, ``"_"`` for anything, a register role name (``"ip"`` is the #ip
+# register), ``"#name"`` for a captured immediate, or ``("@", offset)`` for an
+# absolute jump target relative to the start of the pattern.
+IDIOMS = {
+    "divisor_sum": Idiom(
+        pattern=(
+            ("seti", 1, "_", "i"),
+            ("seti", 1, "_", "j"),
+            ("mulr", "i", "j", "t"),
+            ("eqrr", "t", "n", "t"),
+            ("addr", "t", "ip", "ip"),
+            ("addi", "ip", 1, "ip"),
+            ("addr", "i", "acc", "acc"),
+            ("addi", "j", 1, "j"),
+            ("gtrr", "j", "n", "t"),
+            ("addr", "ip", "t", "ip"),
+            ("seti", ("@", 1), "_", "ip"),
+            ("addi", "i", 1, "i"),
+            ("gtrr", "i", "n", "t"),
+            ("addr", "t", "ip", "ip"),
+            ("seti", ("@", 0), "_", "ip"),
+        ),
+        exit=15,
+        make_step=divisor_sum_step,
+        samples=[{"n": n} for n in range(-1, 13)],
+    ),
+    "division": Idiom(
+        pattern=(
+            ("seti", 0, "_", "k"),
+            ("addi", "k", 1, "t"),
+            ("muli", "t", "#d", "t"),
+            ("gtrr", "t", "y", "t"),
+            ("addr", "t", "ip", "ip"),
+            ("addi", "ip", 1, "ip"),
+            ("seti", ("@", 8), "_", "ip"),
+            ("addi", "k", 1, "k"),
+            ("seti", ("@", 0), "_", "ip"),
+        ),
+        exit=9,
+        make_step=division_step,
+        samples=[{"y": y} for y in (-5, 0, 1, 2, 7, 255, 256, 257, 511, 1000, 4097)],
+    ),
+}
+
+
+def bind_operand(bindings, pattern_operand, value, start):
+    if pattern_operand == "_":
+        return bindings
+    if isinstance(pattern_operand, int):
+        return bindings if pattern_operand == value else None
+    if isinstance(pattern_operand, tuple):
+        return bindings if start + pattern_operand[1] == value else None
+    if pattern_operand in bindings:
+        return bindings if bindings[pattern_operand] == value else None
+    # Different register roles have to be different registers
+    if not pattern_operand.startswith("#") and value in (
+        bound for role, bound in bindings.items() if not role.startswith("#")
+    ):
+        return None
+    return {**bindings, pattern_operand: value}
+
+
+def match_pattern(program, ip, start, pattern, offset=0, bindings=None):
+    """Return the role bindings if ``pattern`` matches at ``start``, else None."""
+    if bindings is None:
+        if ip is None or start + len(pattern) > len(program):
+            return None
+        bindings = {"ip": ip}
+    if offset == len(pattern):
+        return bindings
+    op, *operands = pattern[offset]
+    instr_op, *values = program[start + offset]
+    if op != instr_op:
+        return None
+    orders = [values]
+    if op in COMMUTATIVE:
+        orders.append([values[1], values[0], values[2]])
+    for order in orders:
+        trial = bindings
+        for pattern_operand, value in zip(operands, order):
+            trial = bind_operand(trial, pattern_operand, value, start)
+            if trial is None:
+                break
+        else:
+            trial = match_pattern(program, ip, start, pattern, offset + 1, trial)
+            if trial is not None:
+                return trial
+    return None
+
+
+def verify_idiom(program, ip, match, num_registers=6, cache_dir=None):
+    """
+    Check a matched idiom against the plain interpreter on the idiom's sample
+    register values, starting from the beginning of the pattern. The
+    interpreter is compiled through ``cache_dir`` like ``compile_program``.
+    """
+    idiom = IDIOMS[match.name]
+    compiled = compile_program(program, ip, cache_dir=cache_dir)
+    # An idiom ending the program exits by halting
+    stop_at = {match.exit} if match.exit < len(program) else ()
+    step = idiom.make_step(match, compiled.steps[match.start])
+    for sample in idiom.samples:
+        registers = [7 * (i + 1) for i in range(num_registers)]
+        for role, value in sample.items():
+            registers[match.bindings[role]] = value
+        expected = registers[:]
+        execute(compiled, expected, pc=match.start, stop_at=stop_at)
+        actual = registers[:]
+        # A step may fall back to the interpreter for inputs it does not cover
+        pc = step(actual)
+        if pc == match.exit:
+            actual[ip] = pc
+        else:
+            execute(compiled, actual, pc=pc, stop_at=stop_at)
+        if actual != expected:
+            return False
+    return True
+
+
+def find_idioms(program, ip, verify=True, cache_dir=None):
+    """
+    Find every known hot-loop idiom in ``program``. Matches are checked with
+    ``verify_idiom`` and dropped if the closed form disagrees with the
+    interpreter.
+    """
+    matches = []
+    for start in range(len(program)):
+        for name, idiom in IDIOMS.items():
+            bindings = match_pattern(program, ip, start, idiom.pattern)
+            if bindings is None:
+                continue
+            match = IdiomMatch(name, start, start + idiom.exit, bindings)
+            if not verify or verify_idiom(program, ip, match, cache_dir=cache_dir):
+                matches.append(match)
+    return matches
@@ -0,0 +1,96 @@
+"""Run many ElfCode register files through the same program at once with NumPy."""
+from collections import namedtuple
+
+import numpy as np
+
+RUNNING, HALTED, WATCHED, EXHAUSTED = range(4)
+
+# Vectorized opcodes. ``read`` returns a register column for the lanes being
+# stepped, ``a`` and ``b`` are the raw operands.
+BATCH_OPCODES = {
+    "addr": lambda read, a, b: read(a) + read(b),
+    "addi": lambda read, a, b: read(a) + b,
+    "mulr": lambda read, a, b: read(a) * read(b),
+    "muli": lambda read, a, b: read(a) * b,
+    "banr": lambda read, a, b: read(a) & read(b),
+    "bani": lambda read, a, b: read(a) & b,
+    "borr": lambda read, a, b: read(a) | read(b),
+    "bori": lambda read, a, b: read(a) | b,
+    "setr": lambda read, a, b: read(a),
+    "seti": lambda read, a, b: a,
+    "gtir": lambda read, a, b: (a > read(b)).astype(np.int64),
+    "gtri": lambda read, a, b: (read(a) > b).astype(np.int64),
+    "gtrr": lambda read, a, b: (read(a) > read(b)).astype(np.int64),
+    "eqir": lambda read, a, b: (a == read(b)).astype(np.int64),
+    "eqri": lambda read, a, b: (read(a) == b).astype(np.int64),
+    "eqrr": lambda read, a, b: (read(a) == read(b)).astype(np.int64),
+}
+
+BatchResult = namedtuple("BatchResult", ["registers", "status", "steps"])
+
+
+def run_batch(program, ip, registers, watch_pcs=(), max_steps=None):
+    """
+    Run ``program`` on every row of ``registers``, an ``(N, num_registers)``
+    array-like, until each lane halts, reaches a pc in ``watch_pcs`` or has
+    executed ``max_steps`` instructions.
+
+    Every iteration groups the running lanes by their current pc and executes
+    each distinct instruction once for all lanes at it. Lanes retire on their
+    own, with their ``status`` set to ``HALTED``, ``WATCHED`` or ``EXHAUSTED``
+    and ``steps`` holding the number of instructions each one executed. The
+    #ip register is kept up to date in every lane. Unlike the scalar VM,
+    registers are int64 and wrap around on overflow.
+    """
+    registers = np.array(registers, dtype=np.int64)
+    if registers.ndim != 2:
+        raise ValueError("registers must be a 2D array with one row per lane")
+    num_lanes = len(registers)
+    num_instr = len(program)
+    status = np.full(num_lanes, RUNNING, dtype=np.int8)
+    steps = np.zeros(num_lanes, dtype=np.int64)
+    watch_pcs = np.array(sorted(watch_pcs), dtype=np.int64)
+    # Without an #ip register every lane runs the program top to bottom
+    pcs = np.zeros(num_lanes, dtype=np.int64)
+    active = np.arange(num_lanes)
+
+    while len(active):
+        if ip is not None:
+            pcs[active] = registers[active, ip]
+        lane_pcs = pcs[active]
+        halted = (lane_pcs < 0) | (lane_pcs >= num_instr)
+        # Lanes starting on a watchpoint run it once, so batches can resume
+        watched = ~halted & np.isin(lane_pcs, watch_pcs) & (steps[active] > 0)
+        if max_steps is None:
+            exhausted = np.zeros_like(halted)
+        else:
+            exhausted = ~halted & ~watched & (steps[active] >= max_steps)
+        status[active[halted]] = HALTED
+        status[active[watched]] = WATCHED
+        status[active[exhausted]] = EXHAUSTED
+        running = ~(halted | watched | exhausted)
+        active = active[running]
+        lane_pcs = lane_pcs[running]
+        if not len(active):
+            break
+
+        order = np.argsort(lane_pcs, kind="stable")
+        active = active[order]
+        lane_pcs = lane_pcs[order]
+        group_pcs, group_starts = np.unique(lane_pcs, return_index=True)
+        group_ends = np.append(group_starts[1:], len(active))
+        for pc, group_start, group_end in zip(
+            group_pcs.tolist(), group_starts.tolist(), group_ends.tolist()
+        ):
+            lanes = active[group_start:group_end]
+            op, a, b, c = program[pc]
+            registers[lanes, c] = BATCH_OPCODES[op](
+                lambda register: registers[lanes, register], a, b
+            )
+        if ip is not None:
+            registers[active, ip] += 1
+        else:
+            pcs[active] += 1
+        steps[active] += 1
+
+    return BatchResult(registers, status, steps)